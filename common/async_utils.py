@@ -0,0 +1,130 @@
+"""
+common.utils 的 asyncio 版本 (StreamReader / StreamWriter)
+
+Frame 格式、codec / 壓縮協商與統計都和同步版本完全相同，
+因此 event loop 架構的 server 可以直接服務現有的 client。
+codec / 壓縮設定以 writer 為 key：set_codec(writer, ...) / set_compression(writer, ...)
+"""
+import asyncio
+import os
+import struct
+import time
+import zlib
+
+from common import metrics
+from common.utils import (
+    build_frame, decode_payload, frame_tag, clamp_range, report_throughput,
+    choose_codec, set_codec, get_codec, choose_compression, set_compression, get_compression,
+    check_length, FLAG_REQ_ID, LENGTH_MASK, RECV_FILE_BUFSIZE
+)
+
+async def send_json(writer, data, req_id=None, tag=None):
+    timed = metrics.stats_enabled()
+    start = time.perf_counter() if timed else 0
+    try:
+        frame = build_frame(data, get_codec(writer), get_compression(writer), req_id)
+        writer.write(frame)
+        await writer.drain()
+        if timed:
+            metrics.record('send_json', tag or frame_tag(data), len(frame), (time.perf_counter() - start) * 1000)
+        return True
+    except (ConnectionError, OSError, AttributeError):
+        if timed: metrics.record('send_json', tag or frame_tag(data), 0, 0, ok=False)
+        return False
+    except (TypeError, ValueError) as e:
+        print(f"[Transport] Cannot encode {tag or frame_tag(data)}: {e}")
+        if timed: metrics.record('send_json', tag or frame_tag(data), 0, 0, ok=False)
+        return False
+
+def write_json(writer, data, tag=None):
+    """不等待 drain 的送出 (只放進 transport 的緩衝區)，供 loop.call_soon_threadsafe 推送事件使用"""
+    try:
+        frame = build_frame(data, get_codec(writer), get_compression(writer))
+        writer.write(frame)
+        if metrics.stats_enabled():
+            metrics.record('send_json', tag or frame_tag(data), len(frame), 0)
+        return True
+    except (ConnectionError, OSError, AttributeError, RuntimeError):
+        if metrics.stats_enabled(): metrics.record('send_json', tag or frame_tag(data), 0, 0, ok=False)
+        return False
+    except (TypeError, ValueError) as e:
+        # 在 event loop 的 callback 內執行，編碼失敗也不能讓例外往外丟
+        print(f"[Transport] Cannot encode {tag or frame_tag(data)}: {e}")
+        if metrics.stats_enabled(): metrics.record('send_json', tag or frame_tag(data), 0, 0, ok=False)
+        return False
+
+async def recv_json(reader, compressed=False):
+    return (await recv_message(reader, compressed))[1]
+
+async def recv_message(reader, compressed=False):
+    """
+    讀取一個 frame，回傳 (req_id, data)；沒有 req_id 時為 None，失敗時 data 為 None
+    compressed：這條連線是否協商過壓縮 (壓縮設定記在 writer 上，呼叫端傳入 get_compression(writer))
+    """
+    try:
+        header = await reader.readexactly(4)
+        word = struct.unpack('!I', header)[0]
+        req_id = None
+        if word & FLAG_REQ_ID:
+            req_id = struct.unpack('!I', await reader.readexactly(4))[0]
+        data = await reader.readexactly(check_length(word))
+        start = time.perf_counter()
+        obj = decode_payload(word & ~LENGTH_MASK, data, compressed)
+        if metrics.stats_enabled():
+            metrics.record('recv_json', frame_tag(obj), len(header) + len(data), (time.perf_counter() - start) * 1000)
+        return req_id, obj
+    except (asyncio.IncompleteReadError, ConnectionError, OSError, struct.error, ValueError, zlib.error):
+        return None, None
+
+async def send_file(writer, filepath, offset=0, length=None, tag='FILE'):
+    """送出檔案的 [offset, offset+length) 區段；支援時由 loop.sendfile 走 kernel sendfile"""
+    try:
+        if not os.path.exists(filepath):
+            return False
+        offset, length = clamp_range(os.path.getsize(filepath), offset, length)
+        if not await send_json(writer, {'type': 'FILE_INFO', 'size': length}):
+            return False
+
+        start = time.perf_counter()
+        sent = 0
+        if length:
+            loop = asyncio.get_running_loop()
+            with open(filepath, 'rb') as f:
+                sent = await loop.sendfile(writer.transport, f, offset, length)
+        if sent != length:
+            metrics.record('send_file', tag, 0, 0, ok=False)
+            return False
+        report_throughput('send_file', tag, sent, time.perf_counter() - start)
+        return True
+    except Exception as e:
+        metrics.record('send_file', tag, 0, 0, ok=False)
+        print(f"[Transport Error] Send file failed: {e}")
+        return False
+
+async def recv_file(reader, output_path, size, offset=0, tag='FILE'):
+    """與 common.utils.recv_file 相同：中途斷線時檔案截到實際收到的長度，方便續傳"""
+    try:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        start = time.perf_counter()
+        remaining = size
+        mode = 'r+b' if offset and os.path.exists(output_path) else 'wb'
+        with open(output_path, mode) as f:
+            f.seek(offset)
+            f.truncate(offset + size)
+            try:
+                while remaining > 0:
+                    data = await reader.read(min(remaining, RECV_FILE_BUFSIZE))
+                    if not data:
+                        metrics.record('recv_file', tag, 0, 0, ok=False)
+                        return False
+                    f.write(data)
+                    remaining -= len(data)
+            finally:
+                if remaining > 0:
+                    f.truncate(f.tell())
+        report_throughput('recv_file', tag, size, time.perf_counter() - start)
+        return True
+    except Exception as e:
+        metrics.record('recv_file', tag, 0, 0, ok=False)
+        print(f"[Transport Error] Recv file failed: {e}")
+        return False
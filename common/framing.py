@@ -0,0 +1,143 @@
+# framing.py
+"""
+Length-prefixed framing：每個 frame = 4 bytes big-endian 長度 + payload
+
+大廳 (common/utils.py) 與所有遊戲共用這份實作。
+遊戲上架後是在 Server 端解壓獨立執行，無法 import common，
+所以遊戲請直接複製 (vendor) 此檔案到自己的專案目錄；
+create_game_template.py 建立新專案時會自動放一份。
+遊戲目錄裡的 framing.py 都是此檔案的複本，修改請改這裡再同步過去。
+"""
+import json
+import socket
+import struct
+
+HEADER = struct.Struct('!I')
+HEADER_SIZE = HEADER.size
+MAX_FRAME = 16 * 1024 * 1024
+RECV_BUFSIZE = 64 * 1024
+IOV_MAX = 512 # 單次 sendmsg 最多帶幾個 buffer
+
+class FrameError(ValueError):
+    """frame 長度不合法 (對方送錯格式或惡意封包)"""
+
+def enable_nodelay(sock):
+    """關閉 Nagle，小封包 (操作指令、聊天) 立即送出"""
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (OSError, AttributeError):
+        pass # 非 TCP socket (例如 socketpair) 沒有這個選項
+
+def encode_frame(payload, max_len=MAX_FRAME):
+    n = len(payload)
+    if n > max_len:
+        raise FrameError(f"Frame too large: {n} > {max_len}")
+    return HEADER.pack(n) + payload
+
+def send_frame(sock, payload, max_len=MAX_FRAME):
+    sock.sendall(encode_frame(payload, max_len))
+
+def send_frames(sock, payloads, max_len=MAX_FRAME):
+    """多個 frame 合併成一次 sendmsg (writev)，不必先串成一大塊 bytes，也只需一次 system call"""
+    bufs = []
+    for payload in payloads:
+        if len(payload) > max_len:
+            raise FrameError(f"Frame too large: {len(payload)} > {max_len}")
+        bufs.append(HEADER.pack(len(payload)))
+        bufs.append(payload)
+    if not bufs:
+        return
+    if not hasattr(sock, 'sendmsg'):
+        # Windows 沒有 sendmsg
+        sock.sendall(b''.join(bufs))
+        return
+
+    # 空的 payload 沒有要送的 bytes；留著的話送完前面的資料後 sendmsg 只會一直回傳 0
+    views = [memoryview(b) for b in bufs if len(b)]
+    i = 0
+    while i < len(views):
+        sent = sock.sendmsg(views[i:i + IOV_MAX])
+        # sendmsg 可能只送出一部分，跳過已送完的 buffer，剩下的繼續送
+        while sent and i < len(views):
+            if sent >= len(views[i]):
+                sent -= len(views[i])
+                i += 1
+            else:
+                views[i] = views[i][sent:]
+                sent = 0
+
+def recv_exact(sock, n):
+    """讀滿 n bytes，回傳 bytearray；對方關閉連線則回傳 None"""
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    try:
+        while got < n:
+            nbytes = sock.recv_into(view[got:], n - got)
+            if not nbytes:
+                return None
+            got += nbytes
+        return buf
+    finally:
+        view.release()
+
+def recv_frame(sock, max_len=MAX_FRAME):
+    """讀取一個 frame 的 payload；連線關閉回傳 None，長度不合法丟出 FrameError"""
+    hdr = recv_exact(sock, HEADER_SIZE)
+    if hdr is None:
+        return None
+    (n,) = HEADER.unpack(hdr)
+    if n > max_len:
+        raise FrameError(f"Frame too large: {n} > {max_len}")
+    return recv_exact(sock, n)
+
+class FrameDecoder:
+    """
+    增量解碼器：把 recv 到的任意長度資料 feed 進來，取出所有已完整的 frame
+    適合一次 recv 一大塊、再一口氣處理多個小 frame 的 reader loop
+    """
+    def __init__(self, max_len=MAX_FRAME):
+        self.max_len = max_len
+        self.buf = bytearray()
+
+    def feed(self, data):
+        self.buf += data
+        frames = []
+        pos = 0
+        end = len(self.buf)
+        while end - pos >= HEADER_SIZE:
+            (n,) = HEADER.unpack_from(self.buf, pos)
+            if n > self.max_len:
+                raise FrameError(f"Frame too large: {n} > {self.max_len}")
+            if end - pos - HEADER_SIZE < n:
+                break
+            start = pos + HEADER_SIZE
+            frames.append(bytes(self.buf[start:start + n]))
+            pos = start + n
+        if pos:
+            del self.buf[:pos]
+        return frames
+
+    def read_from(self, sock, bufsize=RECV_BUFSIZE):
+        """從 socket 讀一次並回傳完整的 frame 列表；連線關閉回傳 None"""
+        data = sock.recv(bufsize)
+        if not data:
+            return None
+        return self.feed(data)
+
+# === JSON helpers ===
+
+def dumps(obj):
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def send_json(sock, obj, max_len=MAX_FRAME):
+    send_frame(sock, dumps(obj), max_len)
+
+def send_jsons(sock, objs, max_len=MAX_FRAME):
+    send_frames(sock, [dumps(o) for o in objs], max_len)
+
+def recv_json(sock, max_len=MAX_FRAME):
+    data = recv_frame(sock, max_len)
+    if data is None:
+        return None
+    return json.loads(data)
@@ -0,0 +1,95 @@
+import threading
+
+# 延遲分桶上限 (毫秒)，最後一桶收所有更慢的
+LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+class LatencyHistogram:
+    """固定分桶的延遲統計 (次數 / 總和 / 最大值 / 各桶計數)"""
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        for i, limit in enumerate(self.buckets):
+            if ms <= limit:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def snapshot(self):
+        hist = {f"<={limit}ms": n for limit, n in zip(self.buckets, self.counts)}
+        hist[f">{self.buckets[-1]}ms"] = self.counts[-1]
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0,
+            'max_ms': round(self.max_ms, 3),
+            'histogram': hist
+        }
+
+class _OpStats:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+
+# === Transport metrics (opt-in) ===
+# 關閉時 common.utils 只多一次 is-None 判斷，不計時也不上鎖
+_ops = None
+_lock = threading.Lock()
+
+def enable_stats(enabled=True):
+    global _ops
+    with _lock:
+        _ops = {} if enabled else None
+
+def stats_enabled():
+    return _ops is not None
+
+def reset_stats():
+    with _lock:
+        if _ops is not None:
+            _ops.clear()
+
+def record(op, tag, nbytes, elapsed_ms, ok=True):
+    """op: send_json / recv_json / send_file / recv_file，tag: 指令名稱"""
+    ops = _ops
+    if ops is None:
+        return
+    with _lock:
+        st = ops.get((op, tag))
+        if st is None:
+            st = ops[(op, tag)] = _OpStats()
+        if ok:
+            st.frames += 1
+            st.bytes += nbytes
+            st.latency.observe(elapsed_ms)
+        else:
+            st.errors += 1
+
+def get_stats():
+    """回傳目前統計的快照：{op: {tag: {...}}}，可直接 json.dump"""
+    snap = {}
+    with _lock:
+        for (op, tag), st in (_ops or {}).items():
+            entry = {'frames': st.frames, 'bytes': st.bytes, 'errors': st.errors}
+            entry.update(st.latency.snapshot())
+            snap.setdefault(op, {})[tag] = entry
+    return snap
+
+def format_stats(snap=None):
+    """把快照整理成方便閱讀的表格字串 (依流量排序)"""
+    snap = get_stats() if snap is None else snap
+    lines = [f"{'op':<10} {'tag':<22} {'frames':>8} {'bytes':>12} {'errors':>6} {'avg_ms':>8} {'max_ms':>8}"]
+    for op in sorted(snap):
+        for tag, e in sorted(snap[op].items(), key=lambda kv: -kv[1]['bytes']):
+            lines.append(f"{op:<10} {str(tag):<22} {e['frames']:>8} {e['bytes']:>12} {e['errors']:>6} "
+                         f"{e['avg_ms']:>8} {e['max_ms']:>8}")
+    return "\n".join(lines)
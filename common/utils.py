@@ -2,74 +2,305 @@ import socket
 import json
 import struct
 import os
+import time
+import hashlib
+import weakref
+import zlib
 
-def send_json(sock, data):
+from common.framing import recv_exact, enable_nodelay, FrameError, MAX_FRAME
+from common import metrics
+
+try:
+    import msgpack  # 選用：有安裝才會在登入時協商二進位編碼
+except ImportError:
+    msgpack = None
+
+# === Frame header ===
+# 4 bytes big-endian：高位元為旗標，其餘為 payload 長度
+# 舊版只會送出無旗標的 JSON frame，因此新舊版本可共用同一條連線格式
+FLAG_BINARY = 0x80000000
+FLAG_REQ_ID = 0x40000000 # header 後面接 4 bytes 的 request id
+FLAG_COMPRESSED = 0x20000000 # payload 經過 zlib 壓縮
+LENGTH_MASK = 0x0FFFFFFF
+# header 的長度欄位由對方決定，超過此上限的 frame 直接視為錯誤並斷線，不預先配置 buffer
+MAX_FRAME_SIZE = MAX_FRAME
+
+RECV_FILE_BUFSIZE = 256 * 1024
+
+# 小於此大小的 frame 壓縮效益低，直接送出
+COMPRESS_THRESHOLD = 1024
+COMPRESS_LEVEL = 1
+
+# Server 在登入回覆中宣告的能力，client 據此決定要不要使用
+FEATURES = ['req_id', 'query_games', 'room_events', 'room_query']
+
+# === Codecs ===
+# 依偏好排序，登入時 client 送出自己支援的清單，server 挑第一個雙方都支援的
+SUPPORTED_CODECS = ['msgpack', 'json'] if msgpack else ['json']
+
+_codec_by_sock = weakref.WeakKeyDictionary()
+
+def choose_codec(offered):
+    """從對方提供的 codec 清單中挑出雙方都支援的第一個，預設 json"""
+    for name in offered or []:
+        if name in SUPPORTED_CODECS:
+            return name
+    return 'json'
+
+def set_codec(sock, name):
+    """登入協商完成後，設定此連線之後送出的 frame 所用的編碼"""
+    if name == 'json' or name not in SUPPORTED_CODECS:
+        _codec_by_sock.pop(sock, None)
+    else:
+        _codec_by_sock[sock] = name
+
+def get_codec(sock):
+    try:
+        return _codec_by_sock.get(sock, 'json')
+    except TypeError:
+        return 'json'
+
+# === Compression ===
+SUPPORTED_COMPRESSION = ['zlib']
+
+_compress_socks = weakref.WeakSet()
+
+def choose_compression(offered):
+    for name in offered or []:
+        if name in SUPPORTED_COMPRESSION:
+            return name
+    return None
+
+def set_compression(sock, name):
+    """登入協商完成後，開啟/關閉此連線大型 frame 的壓縮"""
+    if name in SUPPORTED_COMPRESSION:
+        _compress_socks.add(sock)
+    else:
+        _compress_socks.discard(sock)
+
+def get_compression(sock):
+    try:
+        return sock in _compress_socks
+    except TypeError:
+        return False
+
+def encode_json(data):
     try:
-        json_str = json.dumps(data)
-        encoded = json_str.encode('utf-8')
-        header = struct.pack('!I', len(encoded))
-        sock.sendall(header + encoded)
+        return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    except UnicodeEncodeError:
+        # 字串中有落單的 surrogate (例如 "\ud800") 時無法編成 UTF-8，改用 \u 跳脫，對方解出的字串不變
+        return json.dumps(data, separators=(',', ':')).encode('ascii')
+
+def encode_payload(data, codec='json', compress=False):
+    """回傳 (flags, body)"""
+    if codec == 'msgpack':
+        try:
+            flags, body = FLAG_BINARY, msgpack.packb(data, use_bin_type=True)
+        except UnicodeEncodeError:
+            # msgpack 無法編碼落單的 surrogate；每個 frame 都帶有 codec 旗標，這個 frame 改送 JSON
+            flags, body = 0, encode_json(data)
+    else:
+        flags, body = 0, encode_json(data)
+    if compress and len(body) >= COMPRESS_THRESHOLD:
+        packed = zlib.compress(body, COMPRESS_LEVEL)
+        if len(packed) < len(body):
+            flags, body = flags | FLAG_COMPRESSED, packed
+    return flags, body
+
+def inflate(body):
+    """解壓縮 payload；解出來超過 MAX_FRAME_SIZE 丟出 FrameError，不讓很小的 frame 解成巨大的資料"""
+    d = zlib.decompressobj()
+    out = d.decompress(body, MAX_FRAME_SIZE + 1)
+    if len(out) > MAX_FRAME_SIZE or d.unconsumed_tail:
+        raise FrameError(f"Decompressed frame exceeds {MAX_FRAME_SIZE} bytes")
+    return out
+
+def decode_payload(flags, body, compressed=True):
+    """compressed：這條連線是否協商過壓縮，沒有的話收到壓縮過的 frame 視為錯誤"""
+    if flags & FLAG_COMPRESSED:
+        if not compressed:
+            raise FrameError("Compressed frame on a connection without compression")
+        body = inflate(body)
+    if flags & FLAG_BINARY:
+        if not msgpack:
+            raise ValueError("Binary frame received but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False, strict_map_key=False)
+    # json.loads 可直接吃 bytearray (自動偵測 UTF-8)，不需再 decode 複製一份
+    return json.loads(body)
+
+class PreEncoded:
+    """
+    事先編碼好的訊息：同一份資料依 (codec, 是否壓縮) 各只編碼一次，之後直接重用 bytes
+    適合內容很少變動、卻會送給大量 client 的回覆 (例如商城列表)；資料本身不可再修改
+    """
+    __slots__ = ('data', '_bodies')
+
+    def __init__(self, data):
+        self.data = data
+        self._bodies = {}
+
+    def encoded(self, codec='json', compress=False):
+        key = (codec, compress)
+        body = self._bodies.get(key)
+        if body is None:
+            body = self._bodies[key] = encode_payload(self.data, codec, compress)
+        return body
+
+def frame_tag(data):
+    if isinstance(data, PreEncoded):
+        data = data.data
+    if isinstance(data, dict):
+        return data.get('command') or data.get('type') or 'reply'
+    return 'reply'
+
+def build_frame(data, codec='json', compress=False, req_id=None):
+    """編碼成完整的 frame (header + body)，同步與 asyncio 版本共用；data 可以是 PreEncoded"""
+    if isinstance(data, PreEncoded):
+        flags, encoded = data.encoded(codec, compress)
+    else:
+        flags, encoded = encode_payload(data, codec, compress)
+    if req_id is None:
+        return struct.pack('!I', flags | len(encoded)) + encoded
+    return struct.pack('!II', flags | FLAG_REQ_ID | len(encoded), req_id) + encoded
+
+def send_json(sock, data, req_id=None, tag=None):
+    """tag 只用於統計 (預設取 command/type 欄位)；server 回覆時傳入對應的指令名稱"""
+    timed = metrics.stats_enabled()
+    start = time.perf_counter() if timed else 0
+    try:
+        frame = build_frame(data, get_codec(sock), get_compression(sock), req_id)
+        sock.sendall(frame)
+        if timed:
+            metrics.record('send_json', tag or frame_tag(data), len(frame), (time.perf_counter() - start) * 1000)
         return True
     except (socket.error, BrokenPipeError, AttributeError):
         # 對方斷線或 socket 已關閉
+        if timed: metrics.record('send_json', tag or frame_tag(data), 0, 0, ok=False)
+        return False
+    except (TypeError, ValueError) as e:
+        # 資料無法編碼 (例如不支援的型別)；只丟掉這一則，不讓呼叫端的 thread 因此結束
+        print(f"[Transport] Cannot encode {tag or frame_tag(data)}: {e}")
+        if timed: metrics.record('send_json', tag or frame_tag(data), 0, 0, ok=False)
         return False
 
 def recv_json(sock):
+    return recv_message(sock)[1]
+
+def recv_message(sock):
+    """讀取一個 frame，回傳 (req_id, data)；沒有 req_id 時為 None，失敗時 data 為 None"""
     try:
         header = recv_all(sock, 4)
         if not header:
-            return None
-        length = struct.unpack('!I', header)[0]
-        data = recv_all(sock, length)
-        if not data:
-            return None
-        return json.loads(data.decode('utf-8'))
-    except (socket.error, ConnectionResetError, struct.error, json.JSONDecodeError, AttributeError):
-        return None
+            return None, None
+        word = struct.unpack('!I', header)[0]
+        req_id = None
+        if word & FLAG_REQ_ID:
+            id_bytes = recv_all(sock, 4)
+            if not id_bytes:
+                return None, None
+            req_id = struct.unpack('!I', id_bytes)[0]
+        data = recv_all(sock, check_length(word))
+        if data is None:
+            return req_id, None
+        compressed = get_compression(sock)
+        if not metrics.stats_enabled():
+            return req_id, decode_payload(word & ~LENGTH_MASK, data, compressed)
+        # 統計的是解碼耗時，不含等待對方送資料的時間
+        start = time.perf_counter()
+        obj = decode_payload(word & ~LENGTH_MASK, data, compressed)
+        metrics.record('recv_json', frame_tag(obj), len(header) + len(data), (time.perf_counter() - start) * 1000)
+        return req_id, obj
+    except (socket.error, ConnectionResetError, struct.error, ValueError, zlib.error, AttributeError):
+        # ValueError 涵蓋 JSONDecodeError / UnicodeDecodeError / msgpack 格式錯誤
+        return None, None
+
+def check_length(word):
+    """取出 header 中的 payload 長度；超過 MAX_FRAME_SIZE 丟出 FrameError (ValueError)"""
+    n = word & LENGTH_MASK
+    if n > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame too large: {n} > {MAX_FRAME_SIZE}")
+    return n
 
 def recv_all(sock, n):
-    data = b''
+    # 預先配置好整個 frame 的 buffer，用 recv_into 直接寫入，避免 bytes 反覆串接
     try:
-        while len(data) < n:
-            packet = sock.recv(n - len(data))
-            if not packet:
-                return None
-            data += packet
-        return data
+        return recv_exact(sock, n)
     except socket.error:
         return None
 
-def send_file(sock, filepath):
+def clamp_range(filesize, offset=0, length=None):
+    offset = max(0, min(offset, filesize))
+    if length is None or length > filesize - offset:
+        length = filesize - offset
+    return offset, length
+
+def report_throughput(op, tag, nbytes, elapsed):
+    metrics.record(op, tag, nbytes, elapsed * 1000)
+    mbps = nbytes / elapsed / (1024 * 1024) if elapsed > 0 else float('inf')
+    action = "Sent" if op == 'send_file' else "Received"
+    print(f"[Transport] {action} {nbytes} bytes in {elapsed:.3f}s ({mbps:.1f} MB/s)")
+
+def file_sha256(filepath):
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(RECV_FILE_BUFSIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def send_file(sock, filepath, offset=0, length=None, tag='FILE'):
+    """送出檔案的 [offset, offset+length) 區段 (預設整個檔案)"""
     try:
         if not os.path.exists(filepath):
             return False
-        filesize = os.path.getsize(filepath)
+        offset, length = clamp_range(os.path.getsize(filepath), offset, length)
         # 先送檔案資訊
-        if not send_json(sock, {'type': 'FILE_INFO', 'size': filesize}):
+        if not send_json(sock, {'type': 'FILE_INFO', 'size': length}):
             return False
         
+        start = time.perf_counter()
         with open(filepath, 'rb') as f:
-            while True:
-                chunk = f.read(4096)
-                if not chunk: break
-                sock.sendall(chunk)
+            # 交給 kernel 的 sendfile 直接從檔案搬到 socket (不支援時 Python 會自動退回 send)
+            sent = sock.sendfile(f, offset, length) if length else 0
+        if sent != length:
+            metrics.record('send_file', tag, 0, 0, ok=False)
+            return False
+        report_throughput('send_file', tag, sent, time.perf_counter() - start)
         return True
     except Exception as e:
+        metrics.record('send_file', tag, 0, 0, ok=False)
         print(f"[Transport Error] Send file failed: {e}")
         return False
 
-def recv_file(sock, output_path, size):
+def recv_file(sock, output_path, size, offset=0, tag='FILE'):
+    """
+    接收 size bytes 寫到 output_path 的 offset 位置 (offset > 0 代表接續既有的部分檔案)
+    中途斷線時，檔案會截到實際收到的長度，方便下次從斷點續傳
+    """
     try:
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        start = time.perf_counter()
+        buf = bytearray(min(size, RECV_FILE_BUFSIZE) or 1)
+        view = memoryview(buf)
         remaining = size
-        with open(output_path, 'wb') as f:
-            while remaining > 0:
-                chunk_size = 4096 if remaining > 4096 else remaining
-                data = sock.recv(chunk_size)
-                if not data: return False
-                f.write(data)
-                remaining -= len(data)
+        mode = 'r+b' if offset and os.path.exists(output_path) else 'wb'
+        with open(output_path, mode) as f:
+            f.seek(offset)
+            # 先把檔案長度配置好，避免邊寫邊長大
+            f.truncate(offset + size)
+            try:
+                while remaining > 0:
+                    n = sock.recv_into(view, min(remaining, len(buf)))
+                    if not n:
+                        metrics.record('recv_file', tag, 0, 0, ok=False)
+                        return False
+                    f.write(view[:n])
+                    remaining -= n
+            finally:
+                if remaining > 0:
+                    f.truncate(f.tell())
+        report_throughput('recv_file', tag, size, time.perf_counter() - start)
         return True
     except Exception as e:
+        metrics.record('recv_file', tag, 0, 0, ok=False)
         print(f"[Transport Error] Recv file failed: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -6,6 +6,7 @@ import shutil
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_DIR = os.path.join(BASE_DIR, 'template')
 GAMES_DIR = os.path.join(BASE_DIR, 'games')
+FRAMING_SRC = os.path.join(os.path.dirname(BASE_DIR), 'common', 'framing.py')
 
 def create_game(game_name):
     target_dir = os.path.join(GAMES_DIR, game_name)
@@ -34,6 +35,10 @@ def create_game(game_name):
         with open(config_path, 'w', encoding='utf-8') as f:
             f.write(content)
 
+        # 3. 放一份共用的 framing.py (遊戲在 Server 端獨立執行，無法 import common)
+        if os.path.exists(FRAMING_SRC):
+            shutil.copy(FRAMING_SRC, os.path.join(target_dir, 'framing.py'))
+
         print(f"✅ 成功建立遊戲專案: {game_name}")
         print(f"📂 位置: {target_dir}")
         print("🚀 下一步：")
@@ -7,7 +7,7 @@ import json
 import argparse
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from common.utils import send_json, recv_json, send_file
+from common.utils import send_json, recv_json, send_file, set_codec, set_compression, SUPPORTED_CODECS, SUPPORTED_COMPRESSION
 
 HOST = '127.0.0.1'
 PORT = 5555
@@ -112,11 +112,14 @@ def main():
     password = get_valid_input("Password: ")
     if not password: return
     
-    send_json(client, {'command': 'LOGIN', 'payload': {'username': username, 'password': password, 'role': 'developer'}})
+    send_json(client, {'command': 'LOGIN', 'payload': {'username': username, 'password': password, 'role': 'developer',
+                                    'codecs': SUPPORTED_CODECS, 'compression': SUPPORTED_COMPRESSION}})
     resp = recv_json(client)
     print(f"Server: {resp['message']}")
     if resp['status'] != 'success':
         return
+    set_codec(client, resp.get('codec', 'json'))
+    set_compression(client, resp.get('compression'))
 
     while True:
         print("\n=== 開發者選單 ===")
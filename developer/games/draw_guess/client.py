@@ -6,13 +6,16 @@ from tkinter import messagebox
 import json
 import time
 
+import framing
+
 class GarticClient:
     def __init__(self, host, port, user):
         self.user = user
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
             self.sock.connect((host, port))
-            self.sock.sendall(f"{user}\n".encode())
+            framing.enable_nodelay(self.sock)
+            framing.send_frame(self.sock, user.encode())
         except:
             messagebox.showerror("Error", "無法連線到伺服器")
             return
@@ -103,7 +106,7 @@ class GarticClient:
     def clear_canvas(self):
         if self.is_drawer:
             self.canvas.delete("all")
-            self.sock.sendall(b"CLR\n")
+            framing.send_frame(self.sock, b"CLR")
 
     def on_mouse_down(self, event):
         self.last_x, self.last_y = event.x, event.y
@@ -111,8 +114,8 @@ class GarticClient:
     def on_mouse_drag(self, event):
         if not self.is_drawer: return
         self.draw_line(self.last_x, self.last_y, event.x, event.y, self.pen_color, self.pen_size)
-        msg = f"D:{self.last_x},{self.last_y},{event.x},{event.y},{self.pen_color},{self.pen_size}\n"
-        try: self.sock.sendall(msg.encode())
+        msg = f"D:{self.last_x},{self.last_y},{event.x},{event.y},{self.pen_color},{self.pen_size}"
+        try: framing.send_frame(self.sock, msg.encode())
         except: pass
         self.last_x, self.last_y = event.x, event.y
 
@@ -123,8 +126,8 @@ class GarticClient:
         text = self.entry_chat.get().strip()
         if not text: return
         self.entry_chat.delete(0, tk.END)
-        msg = json.dumps({"type": "CHAT", "data": text}) + "\n"
-        try: self.sock.sendall(msg.encode())
+        msg = json.dumps({"type": "CHAT", "data": text})
+        try: framing.send_frame(self.sock, msg.encode())
         except: pass
 
     def log(self, text, tag=None):
@@ -134,15 +137,13 @@ class GarticClient:
         self.chat_log.config(state='disabled')
 
     def network_loop(self):
-        buffer = ""
+        decoder = framing.FrameDecoder()
         while self.running:
             try:
-                data = self.sock.recv(4096).decode()
-                if not data: break
-                buffer += data
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    self.root.after(0, self.process_packet, line.strip())
+                frames = decoder.read_from(self.sock)
+                if frames is None: break
+                for f in frames:
+                    self.root.after(0, self.process_packet, f.decode().strip())
             except: break
         self.root.quit()
 
@@ -219,8 +220,8 @@ class GarticClient:
             top.grab_set() 
             Label(top, text="請選擇要畫的題目:", font=("Microsoft JhengHei", 12)).pack(pady=10)
             def select(idx):
-                msg = json.dumps({"type": "SELECT_WORD", "data": idx}) + "\n"
-                self.sock.sendall(msg.encode())
+                msg = json.dumps({"type": "SELECT_WORD", "data": idx})
+                framing.send_frame(self.sock, msg.encode())
                 top.destroy()
             btn_frame = tk.Frame(top)
             btn_frame.pack(pady=5)
@@ -5,6 +5,8 @@ import random
 import time
 import json
 
+import framing
+
 # 題目庫
 WORD_POOL = {
     "EASY": ["Cat", "Sun", "Cup", "Hat", "Ball", "Tree", "Book", "Fish", "Star", "Eye"],
@@ -25,6 +27,7 @@ class GameServer:
         self.clients = []       
         self.players = {}       
         self.lock = threading.RLock()
+        self.send_locks = {}    # conn -> Lock，避免多個執行緒同時寫同一條連線把 frame 交錯
         
         self.state = STATE_WAITING
         self.drawer = None      
@@ -35,30 +38,43 @@ class GameServer:
         self.running = True
 
     def broadcast(self, msg_type, data, exclude=None):
-        packet = json.dumps({"type": msg_type, "data": data}) + "\n"
-        self._send_raw(packet, exclude)
+        packet = json.dumps({"type": msg_type, "data": data})
+        self._send_frames([packet.encode()], exclude)
 
     def broadcast_raw(self, raw_str, exclude=None):
-        msg = raw_str + "\n"
-        self._send_raw(msg, exclude)
+        self._send_frames([raw_str.encode()], exclude)
 
-    def _send_raw(self, msg, exclude):
+    def _send_frames(self, payloads, exclude):
         with self.lock:
             targets = list(self.clients)
         for c in targets:
             if c != exclude:
-                try: c.sendall(msg.encode())
-                except: pass
+                self._send_to(c, payloads)
+
+    def _send_to(self, conn, payloads):
+        lock = self.send_locks.get(conn)
+        if lock is None: return
+        try:
+            with lock: framing.send_frames(conn, payloads)
+        except: pass
 
     def handle_client(self, conn, addr):
         print(f"Conn: {addr}")
         try:
-            name = conn.recv(1024).decode().strip()
+            framing.enable_nodelay(conn)
+            decoder = framing.FrameDecoder()
+            # 第一個 frame 是玩家名稱
+            frames = []
+            while not frames:
+                frames = decoder.read_from(conn)
+                if frames is None: return
+            name = frames.pop(0).decode().strip()
             color = "#%06x" % random.randint(0, 0xFFFFFF)
             
             with self.lock:
                 self.clients.append(conn)
                 self.players[conn] = {"name": name, "score": 0, "color": color}
+                self.send_locks[conn] = threading.Lock()
             
             self.send_json(conn, "WELCOME", {"name": name, "color": color})
             self.broadcast_player_list()
@@ -78,15 +94,9 @@ class GameServer:
                             "mask": mask
                         })
 
-            while True:
-                data = conn.recv(4096)
-                if not data: break
-                buffer = data.decode()
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    line = line.strip()
-                    if not line: continue
-                    self.process_packet(conn, line)
+            while frames is not None:
+                self.process_frames(conn, frames)
+                frames = decoder.read_from(conn)
 
         except Exception as e:
             print(f"Error {addr}: {e}")
@@ -94,10 +104,8 @@ class GameServer:
             self.disconnect_client(conn)
 
     def send_json(self, conn, mtype, data):
-        try:
-            packet = json.dumps({"type": mtype, "data": data}) + "\n"
-            conn.sendall(packet.encode())
-        except: pass
+        packet = json.dumps({"type": mtype, "data": data})
+        self._send_to(conn, [packet.encode()])
 
     def disconnect_client(self, conn):
         with self.lock:
@@ -105,6 +113,7 @@ class GameServer:
 
             # 移除玩家
             self.clients.remove(conn)
+            self.send_locks.pop(conn, None)
             name = "Unknown"
             if conn in self.players:
                 name = self.players[conn]["name"]
@@ -140,12 +149,25 @@ class GameServer:
             # 這裡不 close socket，讓 client 自己關，server 等待 disconnect
         except: pass
 
-    def process_packet(self, conn, line):
-        if line.startswith("D:") or line.startswith("CLR"):
-            if self.state == STATE_DRAWING and conn == self.drawer:
-                self.broadcast_raw(line, exclude=conn)
-            return
+    def process_frames(self, conn, frames):
+        # 同一次收到的連續筆畫合併成一次轉送 (一次 sendmsg)
+        strokes = []
+        for f in frames:
+            line = f.decode().strip()
+            if not line: continue
+            if line.startswith("D:") or line.startswith("CLR"):
+                strokes.append(line)
+                continue
+            self.relay_strokes(conn, strokes)
+            strokes = []
+            self.process_packet(conn, line)
+        self.relay_strokes(conn, strokes)
+
+    def relay_strokes(self, conn, lines):
+        if lines and self.state == STATE_DRAWING and conn == self.drawer:
+            self._send_frames([l.encode() for l in lines], exclude=conn)
 
+    def process_packet(self, conn, line):
         try:
             msg = json.loads(line)
             mtype = msg.get("type")
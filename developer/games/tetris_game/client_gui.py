@@ -3,7 +3,7 @@ import socket
 import threading
 import json
 import tkinter as tk
-from common import send_json, recv_json, now_ms
+from common import send_json, recv_json, enable_nodelay, now_ms
 
 CELL = 24
 SMALL = 12
@@ -131,6 +131,7 @@ class ClientGUI:
     def net_loop(self):
         try:
             self.sock = socket.create_connection((self.host, self.port), timeout=5)
+            enable_nodelay(self.sock)
             hello = {
                 "type":"HELLO","version":1,"roomId":0,
                 "userId":self.name,"roomToken":self.token,"name":self.name
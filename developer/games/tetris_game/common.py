@@ -1,9 +1,11 @@
 # common.py
 import json
 import socket
-import struct
 import time
 
+import framing
+from framing import enable_nodelay
+
 MAX_LEN = 65536
 
 def send_frame(sock: socket.socket, payload: bytes) -> None:
@@ -12,40 +14,32 @@ def send_frame(sock: socket.socket, payload: bytes) -> None:
     n = len(payload)
     if n <= 0 or n > MAX_LEN:
         raise ValueError(f"Invalid payload length {n}, must be 1..{MAX_LEN}")
-    hdr = struct.pack('!I', n)
-    sock.sendall(hdr + payload)
+    framing.send_frame(sock, payload, MAX_LEN)
 
 def recv_exact(sock: socket.socket, n: int) -> bytes:
-    buf = bytearray()
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
-            return b''
-        buf.extend(chunk)
-    return bytes(buf)
+    buf = framing.recv_exact(sock, n)
+    return bytes(buf) if buf is not None else b''
 
 def recv_frame(sock: socket.socket) -> bytes:
-    hdr = recv_exact(sock, 4)
-    if len(hdr) < 4:
-        return b''
-    (n,) = struct.unpack('!I', hdr)
-    if n <= 0 or n > MAX_LEN:
-        return b''
-    body = recv_exact(sock, n)
-    if len(body) < n:
+    try:
+        body = framing.recv_frame(sock, MAX_LEN)
+    except framing.FrameError:
         return b''
-    return body
+    return bytes(body) if body else b''
 
 def send_json(sock: socket.socket, obj) -> None:
-    data = json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
-    send_frame(sock, data)
+    send_frame(sock, framing.dumps(obj))
+
+def encode_json(obj) -> bytes:
+    """預先編碼好整個 frame，廣播給多人時只需編碼一次"""
+    return framing.encode_frame(framing.dumps(obj), MAX_LEN)
 
 def recv_json(sock: socket.socket):
     data = recv_frame(sock)
     if not data:
         return None
     try:
-        return json.loads(data.decode('utf-8'))
+        return json.loads(data)
     except Exception:
         return None
 
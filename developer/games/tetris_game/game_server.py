@@ -8,7 +8,7 @@ import sys
 from collections import deque
 from dataclasses import dataclass, field
 from typing import List, Dict
-from common import send_json, recv_json, now_ms
+from common import send_json, recv_json, encode_json, enable_nodelay, now_ms
 
 BOARD_W = 10
 BOARD_H = 20
@@ -145,6 +145,7 @@ class GameServer:
             print(f"[GameServer] listening on")
             while self.running:
                 s, addr = srv.accept()
+                enable_nodelay(s)
                 t = threading.Thread(target=self.handle_client, args=(s, addr), daemon=True)
                 t.start()
 
@@ -306,15 +307,16 @@ class GameServer:
 
     def broadcast(self, obj):
         obj["at"] = now_ms()
+        frame = encode_json(obj) # 只編碼一次，所有人共用
         for name, st in list(self.players.items()):
             s = st.sock
             try:
-                send_json(s, obj)
+                s.sendall(frame)
             except Exception:
                 pass
         for spec in list(self.spectators):
             try:
-                send_json(spec, obj)
+                spec.sendall(frame)
             except Exception:
                 self.spectators.discard(spec)
 
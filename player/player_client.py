@@ -10,10 +10,13 @@ import threading
 import importlib.util
 import argparse
 import shutil
+import itertools
+import queue
+import time
 
 # 確保能 import common
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from common.utils import send_json, recv_json, recv_file
+from common.utils import send_json, recv_json, recv_message, recv_file, file_sha256, set_codec, set_compression, enable_nodelay, SUPPORTED_CODECS, SUPPORTED_COMPRESSION
 
 # --- 全域設定 ---
 HOST = '127.0.0.1'
@@ -24,7 +27,13 @@ GLOBAL_PLUGINS_DIR = 'player/plugins' # 插件來源 (商店)
 USER_PLUGINS_DIR = None               # 玩家插件目錄
 PLUGIN_CONFIG_FILE = None             # 玩家設定檔
 
-client_lock = threading.Lock()
+REQUEST_TIMEOUT = 30 # 秒
+DOWNLOAD_TIMEOUT = 15 # 秒，超過視為斷線並續傳
+DOWNLOAD_RETRIES = 5
+STORE_PAGE_SIZE = 20
+ROOM_PAGE_SIZE = 20
+CHAT_HISTORY = 50
+EVENT_POLL_MS = 100 # 房間頁面處理推送事件的間隔 (只讀本地佇列)
 
 DEFAULT_THEME = {
     "main_bg": "#f0f0f0",
@@ -49,11 +58,83 @@ CURRENT_THEME = DEFAULT_THEME.copy()
 
 # === Helper Functions ===
 
+class LobbyConnection:
+    """
+    大廳連線 (單一 socket)
+    - Server 支援 req_id 後，每個請求帶編號，由背景執行緒收回覆並配對回呼叫端，多個請求可同時進行
+    - 舊版 Server 則退回一次一個的 send-and-receive
+    - Server 主動推送的事件 (不帶 req_id 的 ROOM_EVENT) 交給 on_event，在背景執行緒呼叫
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.multiplexed = False
+        self.features = []
+        self.send_lock = threading.Lock()
+        self.serial_lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        self.pending = {}        # req_id -> [Event, response]
+        self.serial_slot = None  # 舊版模式下等待中的請求
+        self.ids = itertools.count(1)
+        self.on_event = None
+        self.closed = False
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def enable_multiplex(self, features):
+        self.features = features or []
+        self.multiplexed = 'req_id' in self.features
+
+    def request(self, req_data, timeout=REQUEST_TIMEOUT):
+        if self.closed: return None
+        slot = [threading.Event(), None]
+        if not self.multiplexed:
+            with self.serial_lock:
+                self.serial_slot = slot
+                with self.send_lock:
+                    ok = send_json(self.sock, req_data)
+                if ok: slot[0].wait(timeout)
+                self.serial_slot = None
+            return slot[1]
+
+        req_id = next(self.ids) & 0xFFFFFFFF
+        with self.pending_lock:
+            self.pending[req_id] = slot
+        with self.send_lock:
+            ok = send_json(self.sock, req_data, req_id=req_id)
+        if ok: slot[0].wait(timeout)
+        with self.pending_lock:
+            self.pending.pop(req_id, None)
+        return slot[1]
+
+    def _read_loop(self):
+        while True:
+            req_id, msg = recv_message(self.sock)
+            if msg is None: break
+            if req_id is None and isinstance(msg, dict) and msg.get('type') == 'ROOM_EVENT':
+                handler = self.on_event
+                if handler: handler(msg)
+                continue
+            if req_id is None:
+                slot = self.serial_slot
+            else:
+                with self.pending_lock:
+                    slot = self.pending.get(req_id)
+            if slot:
+                slot[1] = msg
+                slot[0].set()
+        # 連線中斷：叫醒所有等待中的請求
+        self.closed = True
+        with self.pending_lock:
+            slots = list(self.pending.values())
+        if self.serial_slot: slots.append(self.serial_slot)
+        for slot in slots: slot[0].set()
+
+    def close(self):
+        try: self.sock.close()
+        except: pass
+
 def safe_request(client, req_data):
     try:
-        with client_lock:
-            if send_json(client, req_data):
-                return recv_json(client)
+        return client.request(req_data)
     except Exception as e:
         print(f"Network Error: {e}")
     return None
@@ -96,20 +177,62 @@ def launch_game_client(game_name, username, game_host, game_port, token):
     except Exception as e:
         return False, str(e), None
 
-def download_game_task(client, game_name):
+def _download_attempt(game_name, part_path, meta_path):
+    """下載一次 (若有部分檔案則從斷點接續)，回傳 (狀態, 訊息)，狀態為 done / retry / fail"""
+    offset, sha = 0, None
+    if os.path.exists(part_path) and os.path.exists(meta_path):
+        with open(meta_path, 'r') as f: sha = f.read().strip()
+        offset = os.path.getsize(part_path)
+
+    # 下載走獨立連線，傳檔期間不會卡住大廳連線上的其他請求
+    with socket.create_connection((HOST, PORT), timeout=DOWNLOAD_TIMEOUT) as conn:
+        req = {'command': 'DOWNLOAD_GAME_INIT', 'payload': {'game_name': game_name, 'offset': offset, 'sha256': sha}}
+        if not send_json(conn, req):
+            return 'retry', "發送請求失敗"
+        resp = recv_json(conn)
+        if not resp: return 'retry', "連線中斷"
+        if resp.get('status') != 'ready_to_send':
+            return 'fail', resp.get('message', 'Server error')
+
+        # Server 可能因為版本已更新而要求從頭開始
+        offset = resp.get('offset', 0)
+        sha = resp.get('sha256')
+        if offset == 0 and os.path.exists(part_path): os.remove(part_path)
+        if sha:
+            with open(meta_path, 'w') as f: f.write(sha)
+
+        file_info = recv_json(conn)
+        if not file_info: return 'retry', "傳輸中斷"
+        if not recv_file(conn, part_path, file_info['size'], offset):
+            return 'retry', "傳輸中斷"
+
+    if sha and file_sha256(part_path) != sha:
+        os.remove(part_path)
+        return 'retry', "檔案校驗失敗"
+    return 'done', "下載完成"
+
+def download_game_task(game_name):
     try:
-        with client_lock:
-            if not send_json(client, {'command': 'DOWNLOAD_GAME_INIT', 'payload': {'game_name': game_name}}):
-                return False, "發送請求失敗"
-            resp = recv_json(client)
-            if not resp or resp.get('status') != 'ready_to_send':
-                return False, resp.get('message', 'Server error')
-            file_info = recv_json(client)
-            filesize = file_info['size']
-            save_path = os.path.join(DOWNLOAD_DIR, f"{game_name}.zip")
-            os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-            if not recv_file(client, save_path, filesize):
-                return False, "傳輸中斷"
+        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+        save_path = os.path.join(DOWNLOAD_DIR, f"{game_name}.zip")
+        part_path = save_path + '.part'
+        meta_path = part_path + '.sha256'
+
+        # 斷線時保留已下載的部分，自動重連並從斷點繼續
+        for attempt in range(DOWNLOAD_RETRIES):
+            try:
+                status, msg = _download_attempt(game_name, part_path, meta_path)
+            except OSError as e:
+                status, msg = 'retry', str(e)
+            if status == 'done': break
+            if status == 'fail': return False, msg
+            print(f"[Download] {game_name}: {msg}, 重試中 ({attempt + 1}/{DOWNLOAD_RETRIES})")
+            time.sleep(min(2 ** attempt, 8) * 0.5)
+        else:
+            return False, msg
+
+        os.replace(part_path, save_path)
+        if os.path.exists(meta_path): os.remove(meta_path)
         try:
             with zipfile.ZipFile(save_path, 'r') as zip_ref:
                 extract_path = os.path.join(DOWNLOAD_DIR, game_name)
@@ -206,10 +329,14 @@ class LoginFrame(tk.Frame):
 
         resp = safe_request(self.master.client, {
             'command': 'LOGIN', 
-            'payload': {'username': u, 'password': p, 'role': 'player'}
+            'payload': {'username': u, 'password': p, 'role': 'player',
+                        'codecs': SUPPORTED_CODECS, 'compression': SUPPORTED_COMPRESSION}
         })
 
         if resp and resp['status'] == 'success':
+            set_codec(self.master.client.sock, resp.get('codec', 'json'))
+            set_compression(self.master.client.sock, resp.get('compression'))
+            self.master.client.enable_multiplex(resp.get('features'))
             self.on_login_success(u)
         else:
             msg = resp.get('message', 'Unknown Error') if resp else "Connection Failed"
@@ -243,9 +370,26 @@ class MainDashboard(tk.Frame):
         tk.Button(self.nav_frame, text="登出", command=master.logout, 
                   bg=CURRENT_THEME['btn_danger'], fg="white").pack(side='bottom', fill='x', padx=5, pady=10)
 
+        # 商城查詢結果快取 (依查詢內容)，目錄版本沒變時 server 只回 not_modified
+        self.catalog_cache = {}
+
         self.current_page = None
         self.show_store()
 
+    def cached_request(self, command, payload):
+        key = json.dumps([command, payload], sort_keys=True)
+        cached = self.catalog_cache.get(key)
+        version = cached.get('catalog_version') if cached else None
+        resp = safe_request(self.client, {'command': command, 'payload': dict(payload, catalog_version=version)})
+        if resp and resp['status'] == 'not_modified' and cached:
+            return cached
+        if resp and resp['status'] == 'success':
+            # 目錄已換新版本，其他查詢的快取都過期了
+            version = resp.get('catalog_version')
+            self.catalog_cache = {k: v for k, v in self.catalog_cache.items() if v.get('catalog_version') == version}
+            self.catalog_cache[key] = resp
+        return resp
+
     def create_nav_btn(self, text, command):
         btn = tk.Button(self.nav_frame, text=text, command=command, relief='flat', pady=10, 
                         bg=CURRENT_THEME['nav_bg'], fg=CURRENT_THEME['nav_fg'], 
@@ -271,15 +415,37 @@ class MainDashboard(tk.Frame):
         self.current_page.pack(expand=True, fill='both')
 
 class StorePage(tk.Frame):
+    SORTS = {"評分": 'rating', "名稱": 'name', "最新": 'recent'}
+    TYPES = ["全部", "GUI", "CLI", "Multiplayer"]
+    PLAYERS = ["不限", "1", "2", "3", "4"]
+
     def __init__(self, master, client, username, dashboard):
         super().__init__(master)
         self.configure(bg=CURRENT_THEME['content_bg'])
         self.client = client
         self.username = username
         self.dashboard = dashboard
+        self.games_data = {}
+        self.next_cursor = None
         
         tk.Label(self, text="遊戲商城", font=(CURRENT_THEME['font_family'], 18, "bold"), 
                  bg=CURRENT_THEME['content_bg'], fg=CURRENT_THEME['text_fg']).pack(anchor='w', pady=(0,10))
+
+        # 排序 / 篩選 (server 支援分頁查詢時才顯示)
+        self.paged = 'query_games' in client.features
+        if self.paged:
+            bar = tk.Frame(self, bg=CURRENT_THEME['content_bg'])
+            bar.pack(fill='x', pady=(0, 5))
+            self.sort_var = tk.StringVar(value="評分")
+            self.type_var = tk.StringVar(value="全部")
+            self.players_var = tk.StringVar(value="不限")
+            for label, var, values in (("排序", self.sort_var, list(self.SORTS)),
+                                       ("類型", self.type_var, self.TYPES),
+                                       ("人數", self.players_var, self.PLAYERS)):
+                tk.Label(bar, text=label, bg=CURRENT_THEME['content_bg'], fg=CURRENT_THEME['text_fg']).pack(side='left')
+                box = ttk.Combobox(bar, textvariable=var, values=values, state='readonly', width=12)
+                box.pack(side='left', padx=(2, 10))
+                box.bind("<<ComboboxSelected>>", lambda e: self.load_data())
         
         cols = ("Name", "Type", "Rating", "MinPlayers", "Version", "Status")
         self.tree = ttk.Treeview(self, columns=cols, show='headings', height=15)
@@ -293,28 +459,57 @@ class StorePage(tk.Frame):
                         foreground=CURRENT_THEME['list_fg'], fieldbackground=CURRENT_THEME['list_bg'])
         style.map('Treeview', background=[('selected', CURRENT_THEME['list_select'])])
 
-        tk.Button(self, text="重新整理", command=self.load_data, bg=CURRENT_THEME['btn_bg'], fg=CURRENT_THEME['btn_fg']).pack(pady=10)
+        btns = tk.Frame(self, bg=CURRENT_THEME['content_bg'])
+        btns.pack(pady=10)
+        tk.Button(btns, text="重新整理", command=self.load_data, bg=CURRENT_THEME['btn_bg'], fg=CURRENT_THEME['btn_fg']).pack(side='left', padx=5)
+        self.more_btn = tk.Button(btns, text="載入更多", command=self.load_more, state='disabled',
+                                  bg=CURRENT_THEME['btn_bg'], fg=CURRENT_THEME['btn_fg'])
+        if self.paged: self.more_btn.pack(side='left', padx=5)
         self.load_data()
 
+    def query(self, cursor=None):
+        payload = {'sort': self.SORTS[self.sort_var.get()], 'page_size': STORE_PAGE_SIZE, 'cursor': cursor}
+        if self.type_var.get() != "全部": payload['game_type'] = self.type_var.get()
+        if self.players_var.get() != "不限": payload['min_players'] = int(self.players_var.get())
+        return self.dashboard.cached_request('QUERY_GAMES', payload)
+
     def load_data(self):
         for item in self.tree.get_children(): self.tree.delete(item)
-        resp = safe_request(self.client, {'command': 'LIST_GAMES'})
+        self.games_data = {}
+        self.next_cursor = None
+        if not self.paged:
+            resp = self.dashboard.cached_request('LIST_GAMES', {})
+            if resp and resp['status'] == 'success':
+                self.show_games(resp['games'].items())
+            return
+        self.show_page(self.query())
+
+    def load_more(self):
+        if self.next_cursor:
+            self.show_page(self.query(self.next_cursor))
+
+    def show_page(self, resp):
         if resp and resp['status'] == 'success':
-            self.games_data = resp['games']
-            for name, info in self.games_data.items():
-                local_v = get_local_version(name)
-                status = "未安裝"
-                if local_v:
-                    status = "已安裝" if local_v >= info['version'] else "可更新"
-                
-                self.tree.insert("", "end", values=(
-                    name, 
-                    info.get('game_type', 'GUI'),
-                    f"⭐{info['rating']}",
-                    f"{info.get('min_players', 1)}+",
-                    info['version'],
-                    status
-                ))
+            self.show_games((g['name'], g) for g in resp['games'])
+            self.next_cursor = resp.get('next_cursor')
+        self.more_btn.config(state='normal' if self.next_cursor else 'disabled')
+
+    def show_games(self, games):
+        for name, info in games:
+            self.games_data[name] = info
+            local_v = get_local_version(name)
+            status = "未安裝"
+            if local_v:
+                status = "已安裝" if local_v >= info['version'] else "可更新"
+            
+            self.tree.insert("", "end", values=(
+                name, 
+                info.get('game_type', 'GUI'),
+                f"⭐{info['rating']}",
+                f"{info.get('min_players', 1)}+",
+                info['version'],
+                status
+            ))
 
     def on_item_double_click(self, event):
         item = self.tree.selection()
@@ -367,23 +562,52 @@ class GameDetailWindow(tk.Toplevel):
         tk.Label(self, text="--- 最新評論 ---", bg=CURRENT_THEME['content_bg'], fg=CURRENT_THEME['text_fg']).pack(pady=(20, 5))
         self.review_box = tk.Text(self, height=8, width=40, state='disabled', bg=CURRENT_THEME['list_bg'], fg=CURRENT_THEME['list_fg'])
         self.review_box.pack(padx=10)
+        self.more_btn = tk.Button(self, text="更多評論", command=self.load_more_reviews, state='disabled',
+                                  bg=CURRENT_THEME['btn_bg'], fg=CURRENT_THEME['btn_fg'])
+        self.more_btn.pack(pady=5)
+        self.reviews_cursor = None
         self.load_reviews()
 
     def load_reviews(self):
         resp = safe_request(self.client, {'command': 'GET_GAME_DETAILS', 'payload': {'game_name': self.game_name}})
         if resp and resp['status'] == 'success':
-            reviews = resp['game'].get('reviews', [])
+            game = resp['game']
+            reviews = game.get('reviews', [])
+            if 'reviews_cursor' in game:
+                # 最新一頁 (由新到舊)，其餘用 LIST_REVIEWS 往下翻
+                self.reviews_cursor = game['reviews_cursor']
+            else:
+                # 舊版 server 回傳全部評論 (由舊到新)
+                reviews = reviews[::-1][:5]
+                self.reviews_cursor = None
             self.review_box.config(state='normal')
             self.review_box.delete(1.0, "end")
+            rating = game.get('rating')
+            if rating and rating['count']:
+                self.review_box.insert("end", f"平均 {rating['average']} 分 ({rating['count']} 則評論)\n\n")
             if not reviews:
                 self.review_box.insert("end", "(尚無評論)")
-            for r in reviews[-5:]:
-                self.review_box.insert("end", f"[{r['user']}] {r['score']}分: {r['comment']}\n")
             self.review_box.config(state='disabled')
+            self.show_reviews(reviews)
+
+    def load_more_reviews(self):
+        if self.reviews_cursor is None: return
+        resp = safe_request(self.client, {'command': 'LIST_REVIEWS', 'payload': {
+            'game_name': self.game_name, 'cursor': self.reviews_cursor}})
+        if resp and resp['status'] == 'success':
+            self.reviews_cursor = resp['next_cursor']
+            self.show_reviews(resp['reviews'])
+
+    def show_reviews(self, reviews):
+        self.review_box.config(state='normal')
+        for r in reviews:
+            self.review_box.insert("end", f"[{r['user']}] {r['score']}分: {r['comment']}\n")
+        self.review_box.config(state='disabled')
+        self.more_btn.config(state='normal' if self.reviews_cursor is not None else 'disabled')
 
     def do_download(self):
         self.config(cursor="wait")
-        ok, msg = download_game_task(self.client, self.game_name)
+        ok, msg = download_game_task(self.game_name)
         self.config(cursor="")
         messagebox.showinfo("下載結果", msg)
         if ok: self.destroy() 
@@ -479,14 +703,36 @@ class LibraryPage(tk.Frame):
 
 
 class RoomListPage(tk.Frame):
+    STATUSES = {"全部": None, "等待中": 'waiting', "遊戲中": 'playing'}
+
     def __init__(self, master, client, username, dashboard):
         super().__init__(master)
         self.configure(bg=CURRENT_THEME['content_bg'])
         self.client = client
         self.dashboard = dashboard
+        self.next_cursor = None
         
         tk.Label(self, text="活躍房間列表", font=(CURRENT_THEME['font_family'], 18, "bold"),
                  bg=CURRENT_THEME['content_bg'], fg=CURRENT_THEME['text_fg']).pack(anchor='w')
+
+        # 篩選 (server 支援房間查詢時才顯示)
+        self.paged = 'room_query' in client.features
+        if self.paged:
+            bar = tk.Frame(self, bg=CURRENT_THEME['content_bg'])
+            bar.pack(fill='x', pady=(5, 0))
+            tk.Label(bar, text="遊戲", bg=CURRENT_THEME['content_bg'], fg=CURRENT_THEME['text_fg']).pack(side='left')
+            self.game_var = tk.StringVar()
+            entry = tk.Entry(bar, textvariable=self.game_var, width=16, bg=CURRENT_THEME['entry_bg'], fg=CURRENT_THEME['entry_fg'])
+            entry.pack(side='left', padx=(2, 10))
+            entry.bind("<Return>", lambda e: self.load_data())
+            tk.Label(bar, text="狀態", bg=CURRENT_THEME['content_bg'], fg=CURRENT_THEME['text_fg']).pack(side='left')
+            self.status_var = tk.StringVar(value="全部")
+            box = ttk.Combobox(bar, textvariable=self.status_var, values=list(self.STATUSES), state='readonly', width=8)
+            box.pack(side='left', padx=(2, 10))
+            box.bind("<<ComboboxSelected>>", lambda e: self.load_data())
+            self.free_var = tk.BooleanVar(value=False)
+            tk.Checkbutton(bar, text="只顯示有空位", variable=self.free_var, command=self.load_data,
+                           bg=CURRENT_THEME['content_bg'], fg=CURRENT_THEME['text_fg']).pack(side='left')
         
         cols = ("ID", "Game", "Host", "Status", "Players")
         self.tree = ttk.Treeview(self, columns=cols, show='headings', height=15)
@@ -496,18 +742,43 @@ class RoomListPage(tk.Frame):
         self.tree.bind("<Double-1>", self.do_join)
 
         tk.Button(self, text="加入選定房間", command=self.do_join, bg=CURRENT_THEME['btn_bg'], fg=CURRENT_THEME['btn_fg']).pack(pady=5)
-        tk.Button(self, text="重新整理", command=self.load_data, bg=CURRENT_THEME['btn_bg'], fg=CURRENT_THEME['btn_fg']).pack(pady=5)
+        btns = tk.Frame(self, bg=CURRENT_THEME['content_bg'])
+        btns.pack(pady=5)
+        tk.Button(btns, text="重新整理", command=self.load_data, bg=CURRENT_THEME['btn_bg'], fg=CURRENT_THEME['btn_fg']).pack(side='left', padx=5)
+        self.more_btn = tk.Button(btns, text="載入更多", command=self.load_more, state='disabled',
+                                  bg=CURRENT_THEME['btn_bg'], fg=CURRENT_THEME['btn_fg'])
+        if self.paged: self.more_btn.pack(side='left', padx=5)
         
         self.load_data()
 
+    def query(self, cursor=None):
+        payload = {'page_size': ROOM_PAGE_SIZE, 'cursor': cursor, 'free_slots': self.free_var.get()}
+        if self.game_var.get().strip(): payload['game_name'] = self.game_var.get().strip()
+        if self.STATUSES[self.status_var.get()]: payload['status'] = self.STATUSES[self.status_var.get()]
+        return safe_request(self.client, {'command': 'LIST_ROOMS', 'payload': payload})
+
     def load_data(self):
         for i in self.tree.get_children(): self.tree.delete(i)
-        resp = safe_request(self.client, {'command': 'LIST_ROOMS'})
+        self.next_cursor = None
+        if not self.paged:
+            self.show_page(safe_request(self.client, {'command': 'LIST_ROOMS'}))
+            return
+        self.show_page(self.query())
+
+    def load_more(self):
+        if self.next_cursor:
+            self.show_page(self.query(self.next_cursor))
+
+    def show_page(self, resp):
         if resp and resp['status'] == 'success':
             for rid, r in resp['rooms'].items():
+                players = len(r['players'])
                 self.tree.insert("", "end", values=(
-                    rid, r['game_name'], r['host'], r['status'], len(r['players'])
+                    rid, r['game_name'], r['host'], r['status'],
+                    f"{players}/{r['max_players']}" if 'max_players' in r else players
                 ))
+            self.next_cursor = resp.get('next_cursor')
+        self.more_btn.config(state='normal' if self.next_cursor else 'disabled')
 
     def do_join(self, event=None):
         sel = self.tree.selection()
@@ -518,7 +789,7 @@ class RoomListPage(tk.Frame):
         
         if not get_local_version(gname):
             if messagebox.askyesno("未安裝", f"尚未安裝 {gname}，是否前往下載？"):
-                ok, msg = download_game_task(self.client, gname)
+                ok, msg = download_game_task(gname)
                 if not ok: 
                     messagebox.showerror("下載失敗", msg)
                     return
@@ -544,6 +815,9 @@ class RoomLobbyPage(tk.Frame):
         self.game_proc = None
         self.music_player = None
         self.game_name = ""
+        self.info = None
+        self.events = queue.Queue()
+        self.subscribed = False
 
         mp = load_music_plugin()
         if mp:
@@ -568,22 +842,84 @@ class RoomLobbyPage(tk.Frame):
         tk.Button(self, text="離開房間 (Leave)", command=self.do_leave, 
                   bg=CURRENT_THEME['btn_danger'], fg="white").pack(pady=5)
 
-        self.after(500, self.poll_room_info)
+        self.after(500, self.enter_room)
+
+    def enter_room(self):
+        if 'room_events' not in self.client.features:
+            self.poll_room_info() # 舊版 server：每秒輪詢
+            return
+        # 先掛上事件佇列再訂閱，快照之後的事件都不會漏掉
+        self.client.on_event = self.events.put
+        info = safe_request(self.client, {'command': 'SUBSCRIBE_ROOM', 'payload': {'room_id': self.room_id}})
+        if self.show_room_info(info):
+            self.subscribed = True
+            self.after(EVENT_POLL_MS, self.process_events)
 
     def poll_room_info(self):
         if not self.running: return
-        
+        if self.check_game_end(): return
+        payload = {'room_id': self.room_id}
+        if self.info and 'chat_seq' in self.info:
+            payload['chat_since'] = self.info['chat_seq'] # 只拿新的聊天內容
+        info = safe_request(self.client, {'command': 'GET_ROOM_INFO', 'payload': payload})
+        if info and 'chat_since' in payload and info.get('status') == 'success':
+            info['chat_history'] = (self.info['chat_history'] + info['chat_history'])[-CHAT_HISTORY:]
+        if self.show_room_info(info):
+            self.after(1000, self.poll_room_info)
+
+    def process_events(self):
+        if not self.running: return
+        if self.check_game_end(): return
+        if self.client.closed:
+            messagebox.showerror("連線中斷", "房間已關閉或連線中斷")
+            self.do_leave(force=True)
+            return
+        changed = False
+        while True:
+            try: event = self.events.get_nowait()
+            except queue.Empty: break
+            changed = self.apply_event(event) or changed
+        if changed:
+            self.show_room_info(self.info)
+        self.after(EVENT_POLL_MS, self.process_events)
+
+    def apply_event(self, event):
+        """把一則 ROOM_EVENT 套用到 self.info (與 GET_ROOM_INFO 相同的格式)"""
+        info = self.info
+        if event.get('room_id') != self.room_id or event['seq'] <= info.get('seq', 0):
+            return False
+        info['seq'] = event['seq']
+        kind = event.get('event')
+        if kind == 'joined' and event['user'] not in info['players']:
+            info['players'].append(event['user'])
+        elif kind == 'left' and event['user'] in info['players']:
+            info['players'].remove(event['user'])
+        elif kind == 'host':
+            info['host'] = event['host']
+        elif kind == 'chat':
+            info['chat_history'] = (info['chat_history'] + [event['line']])[-CHAT_HISTORY:]
+            info['chat_seq'] = event.get('chat_seq', info.get('chat_seq'))
+        elif kind == 'status':
+            info['room_status'] = event['status']
+            info['game_port'] = event.get('game_port')
+            info['token'] = event.get('token')
+        return True
+
+    def check_game_end(self):
         if self.in_game and self.game_proc:
             if self.game_proc.poll() is not None:
                 self.on_game_end()
-                return
+                return True
+        return False
 
-        info = safe_request(self.client, {'command': 'GET_ROOM_INFO', 'payload': {'room_id': self.room_id}})
+    def show_room_info(self, info):
+        """更新畫面；房間已關閉或連線中斷時離開並回傳 False"""
         if not info or info.get('status') != 'success':
             messagebox.showerror("連線中斷", "房間已關閉或連線中斷")
             self.do_leave(force=True)
-            return
+            return False
 
+        self.info = info
         self.game_name = info.get('game_name')
         host = info.get('host')
         players = info.get('players', [])
@@ -599,8 +935,12 @@ class RoomLobbyPage(tk.Frame):
 
         if status == 'playing' and not self.in_game:
             self.start_game_client(info)
+        return True
 
-        self.after(1000, self.poll_room_info)
+    def stop_events(self):
+        self.running = False
+        if self.client.on_event == self.events.put:
+            self.client.on_event = None
 
     def start_game_client(self, info):
         self.in_game = True
@@ -623,7 +963,7 @@ class RoomLobbyPage(tk.Frame):
     def on_game_end(self):
         self.in_game = False
         self.game_proc = None
-        self.running = False 
+        self.stop_events()
         safe_request(self.client, {'command': 'LEAVE_ROOM', 'payload': {'room_id': self.room_id}})
         if self.music_player: self.music_player.stop()
         
@@ -641,8 +981,11 @@ class RoomLobbyPage(tk.Frame):
         self.destroy()
 
     def do_start(self):
-        # 1. 取得最新房間資訊以確認即時人數
-        info = safe_request(self.client, {'command': 'GET_ROOM_INFO', 'payload': {'room_id': self.room_id}})
+        # 1. 取得最新房間資訊以確認即時人數 (已訂閱時本地狀態就是最新的)
+        if self.subscribed:
+            info = self.info
+        else:
+            info = safe_request(self.client, {'command': 'GET_ROOM_INFO', 'payload': {'room_id': self.room_id}})
         if not info or info.get('status') != 'success':
             return 
             
@@ -680,7 +1023,7 @@ class RoomLobbyPage(tk.Frame):
             messagebox.showwarning("無法開始", resp.get('message'))
 
     def do_leave(self, force=False):
-        self.running = False
+        self.stop_events()
         if self.music_player: self.music_player.stop()
         if not force:
             safe_request(self.client, {'command': 'LEAVE_ROOM', 'payload': {'room_id': self.room_id}})
@@ -805,13 +1148,15 @@ class GameStoreApp(tk.Tk):
         HOST = args.host
         PORT = args.port
         
-        self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            self.client.connect((HOST, PORT))
+            sock.connect((HOST, PORT))
+            enable_nodelay(sock)
         except:
             messagebox.showerror("Error", f"無法連線至 {HOST}:{PORT}")
             self.destroy()
             return
+        self.client = LobbyConnection(sock)
 
         self.show_login()
 
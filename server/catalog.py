@@ -0,0 +1,134 @@
+"""
+商城目錄：每款遊戲的摘要 (LIST_GAMES 回傳的欄位) 與各種排序方式的索引
+
+上架 / 下架 / 評分後由 server 呼叫 refresh(name) 增量更新，查詢時不必重新排序。
+每次變動都會換新的 catalog_version，並丟掉預先編碼好的 LIST_GAMES 回覆；
+client 帶著目前的版本號來查詢時只回 not_modified。
+"""
+import bisect
+import threading
+import time
+
+from common.utils import PreEncoded
+
+SORT_KEYS = ('rating', 'name', 'recent')
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def sort_key(sort, name, info):
+    # 每個 key 都以遊戲名稱結尾：索引中不會有重複的 key，也可以直接當作分頁 cursor
+    if sort == 'rating':
+        return (-info['rating'], -info['rating_count'], name)
+    if sort == 'recent':
+        return (-info.get('updated', 0), name)
+    return (name,)
+
+class Catalog:
+    def __init__(self, store):
+        self.store = store
+        # 版本號以啟動時間起算，重開 server 後舊的版本號不會誤判為相同
+        self.version = int(time.time() * 1000)
+        self._lock = threading.Lock()
+        self._summaries = {}
+        self._keys = {} # name -> {sort: key}
+        self._indexes = {sort: [] for sort in SORT_KEYS}
+        self._list_reply = None
+
+    def load(self):
+        with self._lock:
+            for name, info in self.store.list_games():
+                self._put(name, info)
+
+    def refresh(self, name):
+        """上架 / 下架 / 評分後呼叫：重新讀取此遊戲，更新索引並換新版本號"""
+        info = self.store.get_game(name)
+        if info is not None:
+            info['rating'], info['rating_count'] = self.store.ratings.summary(name)
+        with self._lock:
+            if info is None:
+                self._drop(name)
+            else:
+                self._put(name, info)
+            self.version += 1
+            self._list_reply = None
+
+    def _put(self, name, info):
+        self._drop(name)
+        self._summaries[name] = {
+            'version': info['version'],
+            'author': info['author'],
+            'description': info['description'],
+            'rating': round(info['rating'], 1),
+            'rating_count': info['rating_count'],
+            'min_players': info.get('min_players', 1),
+            'game_type': info.get('game_type', 'GUI')
+        }
+        keys = self._keys[name] = {sort: sort_key(sort, name, info) for sort in SORT_KEYS}
+        for sort, key in keys.items():
+            bisect.insort(self._indexes[sort], key)
+
+    def _drop(self, name):
+        keys = self._keys.pop(name, None)
+        if keys is None:
+            return
+        for sort, key in keys.items():
+            index = self._indexes[sort]
+            del index[bisect.bisect_left(index, key)]
+        del self._summaries[name]
+
+    def not_modified(self, client_version):
+        """呼叫前需持有 self._lock"""
+        if client_version is not None and client_version == self.version:
+            return {'status': 'not_modified', 'catalog_version': self.version}
+        return None
+
+    def list_reply(self, client_version=None):
+        """完整目錄 (LIST_GAMES)，同一個版本只建一次、每種編碼只編碼一次"""
+        with self._lock:
+            unchanged = self.not_modified(client_version)
+            if unchanged:
+                return unchanged
+            if self._list_reply is None:
+                self._list_reply = PreEncoded({
+                    'status': 'success', 'games': dict(self._summaries), 'catalog_version': self.version
+                })
+            return self._list_reply
+
+    def query(self, sort='rating', cursor=None, page_size=DEFAULT_PAGE_SIZE,
+              game_type=None, min_players=None, author=None, client_version=None):
+        """
+        依 sort 排序後取一頁；cursor 是上一頁回傳的 next_cursor
+        min_players：只列出最少人數不超過此值的遊戲 (也就是這麼多人就能開始玩)
+        """
+        if sort not in SORT_KEYS:
+            return {'status': 'fail', 'message': f'Unknown sort: {sort}'}
+        if not isinstance(page_size, int) or page_size <= 0:
+            page_size = DEFAULT_PAGE_SIZE
+        page_size = min(page_size, MAX_PAGE_SIZE)
+
+        with self._lock:
+            unchanged = self.not_modified(client_version)
+            if unchanged:
+                return unchanged
+            index = self._indexes[sort]
+            try:
+                start = bisect.bisect_right(index, tuple(cursor)) if cursor else 0
+            except TypeError:
+                return {'status': 'fail', 'message': 'Invalid cursor'}
+
+            games = []
+            next_cursor = None
+            for i in range(start, len(index)):
+                key = index[i]
+                name = key[-1]
+                s = self._summaries[name]
+                if game_type and s['game_type'] != game_type: continue
+                if author and s['author'] != author: continue
+                if min_players is not None and s['min_players'] > min_players: continue
+                if len(games) == page_size:
+                    # 後面還有符合條件的遊戲
+                    next_cursor = list(self._keys[games[-1]['name']][sort])
+                    break
+                games.append(dict(s, name=name))
+            return {'status': 'success', 'games': games, 'next_cursor': next_cursor,
+                    'catalog_version': self.version}
@@ -0,0 +1,52 @@
+"""
+預先啟動的遊戲 server 行程 (由 server.worker_pool 管理)
+
+用法：python game_worker.py <script>，工作目錄為遊戲解壓後的目錄
+啟動後先載入 script 最上層的 import 並編譯好程式碼，接著等待 stdin 送來一行 JSON (遊戲 server 的參數)，
+收到後以 __main__ 身分執行 script，效果與 python <script> <參數> 相同；
+stdin 在收到參數前就關閉 (大廳結束或回收閒置行程) 則直接離開。
+"""
+import ast
+import importlib
+import json
+import os
+import sys
+import types
+
+def warm_imports(tree):
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass # 執行 script 時會再 import 一次，錯誤交給遊戲自己處理
+
+def main():
+    script = sys.argv[1]
+    path = os.path.abspath(script)
+    sys.path[0] = os.path.dirname(path) # 與直接執行 script 時相同
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), path)
+    code = compile(tree, path, 'exec')
+    warm_imports(tree)
+
+    line = sys.stdin.readline()
+    if not line:
+        return
+    sys.argv = [script] + json.loads(line)
+    sys.stdin = open(os.devnull)
+
+    main_module = types.ModuleType('__main__')
+    main_module.__file__ = path
+    main_module.__builtins__ = __builtins__
+    sys.modules['__main__'] = main_module
+    exec(code, main_module.__dict__)
+
+if __name__ == '__main__':
+    main()
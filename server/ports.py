@@ -0,0 +1,73 @@
+"""
+遊戲 server 的 port 分配
+
+在固定範圍內依序出租 port，每場比賽 (房間) 一個，並記住由哪個遊戲 server 行程使用；
+行程結束後才收回，排到佇列最後 (剛關閉的 port 最晚被重用)。
+同一時間不會把同一個 port 交給兩場比賽，也不必隨機猜測、反覆試 bind。
+"""
+import socket
+import threading
+from collections import deque
+
+GAME_PORT_START = 10000
+GAME_PORT_END = 20000 # 不含
+
+def port_available(port):
+    """與遊戲 server 相同的方式 (SO_REUSEADDR) 試 bind，排除被其他程式佔用的 port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            s.bind(('', port))
+            return True
+        except OSError:
+            return False
+
+class PortAllocator:
+    def __init__(self, start=GAME_PORT_START, end=GAME_PORT_END):
+        self.start = start
+        self.end = end
+        self._lock = threading.Lock()
+        self._free = deque(range(start, end))
+        self._leases = {} # port -> [room_id, Popen (啟動前為 None)]
+
+    def lease(self, rid):
+        """為房間 rid 保留一個 port；範圍內都在使用中時丟出 RuntimeError"""
+        with self._lock:
+            self._reap()
+            for _ in range(len(self._free)):
+                port = self._free.popleft()
+                if port_available(port):
+                    self._leases[port] = [rid, None]
+                    return port
+                self._free.append(port) # 被大廳以外的程式佔用，之後再試
+        raise RuntimeError("No free port found")
+
+    def attach(self, port, proc):
+        """記錄使用這個 port 的遊戲 server 行程，行程結束後收回"""
+        with self._lock:
+            lease = self._leases.get(port)
+            if lease is not None:
+                lease[1] = proc
+
+    def release(self, port):
+        """遊戲 server 沒有啟動成功時直接歸還"""
+        with self._lock:
+            if self._leases.pop(port, None) is not None:
+                self._free.append(port)
+
+    def reap(self):
+        with self._lock:
+            return self._reap()
+
+    def _reap(self):
+        # poll() 同時回收已結束的子行程，不會留下 zombie
+        done = [port for port, (_, proc) in self._leases.items() if proc is not None and proc.poll() is not None]
+        for port in done:
+            del self._leases[port]
+            self._free.append(port)
+        return len(done)
+
+    def stats(self):
+        with self._lock:
+            self._reap()
+            return {'range': [self.start, self.end], 'leased': len(self._leases), 'free': len(self._free)}
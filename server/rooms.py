@@ -0,0 +1,220 @@
+"""
+遊戲房間與房間索引
+
+房間只存在記憶體，重開 server 就會清空。
+鎖的順序：room.lock → RoomRegistry 的鎖；RoomRegistry 只保護索引本身，
+改動房間成員 / 狀態的方法都要在持有 room.lock 時呼叫，索引才會和房間內容一致。
+"""
+import bisect
+import itertools
+import threading
+from collections import deque
+
+from common.utils import PreEncoded
+
+CHAT_HISTORY = 50 # 每個房間保留的聊天行數
+FIRST_ROOM_ID = 100
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+class Room:
+    """一個房間的狀態；建立之後的欄位都在 self.lock 內讀寫"""
+    def __init__(self, rid, host, game_name, max_players):
+        self.rid = rid
+        self.host = host
+        self.game_name = game_name
+        self.max_players = max_players # 建立房間時遊戲設定的人數上限
+        self.players = [host]
+        self.status = 'waiting'
+        self.port = None
+        self.token = None
+        self.chat = deque(maxlen=CHAT_HISTORY) # 最近的聊天內容，最後一行的序號是 chat_seq
+        self.chat_seq = 0
+        self.starting = False # START_GAME 正在啟動遊戲 server，暫不接受加入
+        self.closed = False # 已從索引移除，拿到舊參照的請求要當作房間不存在
+        self.subscribers = {} # user -> session.push，只有房間成員可以訂閱
+        self.seq = 0 # 每個事件的序號，client 用來略過比快照舊的事件
+        self.lock = threading.Lock()
+
+    def publish(self, event, **fields):
+        """推送房間事件給所有訂閱者；呼叫前需持有 self.lock (push 不會阻塞，事件順序與序號一致)"""
+        self.seq += 1
+        if not self.subscribers:
+            return
+        msg = PreEncoded(dict(fields, type='ROOM_EVENT', room_id=self.rid, event=event, seq=self.seq))
+        for push in self.subscribers.values():
+            push(msg)
+
+    def add_chat(self, line):
+        """呼叫前需持有 self.lock；回傳這一行的序號"""
+        self.chat_seq += 1
+        self.chat.append(line)
+        return self.chat_seq
+
+    def chat_since(self, since=None):
+        """序號大於 since 的聊天內容；since 早於緩衝區時從最舊的一行開始"""
+        if not since:
+            return list(self.chat)
+        # 序號連續，由差值直接算出位置
+        newer = self.chat_seq - since
+        if newer <= 0:
+            return []
+        return list(itertools.islice(self.chat, max(0, len(self.chat) - newer), None))
+
+    def snapshot(self, game_host, chat_since=None):
+        """GET_ROOM_INFO / SUBSCRIBE_ROOM 的回覆內容；呼叫前需持有 self.lock"""
+        return {
+            'status': 'success', 'room_status': self.status,
+            'players': list(self.players), 'host': self.host,
+            'game_host': game_host,
+            'game_port': self.port,
+            'token': self.token, 'game_name': self.game_name,
+            'chat_history': self.chat_since(chat_since),
+            'chat_seq': self.chat_seq,
+            'seq': self.seq
+        }
+
+    def summary(self):
+        """LIST_ROOMS 列出的欄位；呼叫前需持有 self.lock"""
+        return {
+            'game_name': self.game_name, 'host': self.host,
+            'status': self.status, 'players': list(self.players),
+            'max_players': self.max_players
+        }
+
+class RoomRegistry:
+    """
+    所有房間：rid → Room，加上 玩家 → 所在房間、遊戲 → 房間、狀態 → 房間 三個索引
+    以及 LIST_ROOMS 的摘要快取 (房間有變動才更新該房間的摘要，整份回覆每種編碼只編碼一次)
+    """
+    def __init__(self, max_rooms):
+        self.max_rooms = max_rooms
+        self._lock = threading.Lock()
+        self._rooms = {}
+        self._by_user = {} # user -> {rid}
+        self._by_game = {} # game_name -> {rid}
+        self._by_status = {} # 'waiting' / 'playing' -> {rid}
+        self._summaries = {}
+        self._list_reply = None
+        # 房號只增不減，刪除房間後也不會和現有房間撞號
+        self._ids = itertools.count(FIRST_ROOM_ID)
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def get(self, rid):
+        with self._lock:
+            return self._rooms.get(rid)
+
+    def create(self, host, game_name, max_players):
+        """建立房間並把 host 登記為成員；房間數已達上限時回傳 None"""
+        with self._lock:
+            if len(self._rooms) >= self.max_rooms:
+                return None
+            room = Room(str(next(self._ids)), host, game_name, max_players)
+            self._rooms[room.rid] = room
+            self._by_game.setdefault(game_name, set()).add(room.rid)
+            self._by_user.setdefault(host, set()).add(room.rid)
+            self._by_status.setdefault(room.status, set()).add(room.rid)
+            self._summaries[room.rid] = room.summary()
+            self._list_reply = None
+        return room
+
+    def rooms_of(self, user):
+        """user 所在的房間 (斷線清理用)"""
+        with self._lock:
+            return [self._rooms[rid] for rid in self._by_user.get(user, ())]
+
+    def add_player(self, room, user):
+        """呼叫前需持有 room.lock"""
+        room.players.append(user)
+        with self._lock:
+            self._by_user.setdefault(user, set()).add(room.rid)
+            self._update(room)
+
+    def remove_player(self, room, user):
+        """呼叫前需持有 room.lock；房間因此變空時一併關閉並回傳 True"""
+        room.players.remove(user)
+        with self._lock:
+            self._unlink(self._by_user, user, room.rid)
+            if room.players:
+                self._update(room)
+                return False
+            room.closed = True
+            del self._rooms[room.rid]
+            old = self._summaries.pop(room.rid)
+            self._unlink(self._by_game, room.game_name, room.rid)
+            self._unlink(self._by_status, old['status'], room.rid)
+            self._list_reply = None
+            return True
+
+    def changed(self, room):
+        """房主或狀態改變後呼叫，呼叫前需持有 room.lock"""
+        with self._lock:
+            self._update(room)
+
+    def _update(self, room):
+        if room.closed:
+            return
+        old = self._summaries[room.rid]
+        if old['status'] != room.status:
+            self._unlink(self._by_status, old['status'], room.rid)
+            self._by_status.setdefault(room.status, set()).add(room.rid)
+        self._summaries[room.rid] = room.summary()
+        self._list_reply = None
+
+    @staticmethod
+    def _unlink(index, key, rid):
+        rids = index.get(key)
+        if rids is not None:
+            rids.discard(rid)
+            if not rids:
+                del index[key]
+
+    def list_reply(self):
+        """完整的房間列表 (LIST_ROOMS)，房間沒有變動時直接重用"""
+        with self._lock:
+            if self._list_reply is None:
+                self._list_reply = PreEncoded({'status': 'success', 'rooms': dict(self._summaries)})
+            return self._list_reply
+
+    def query(self, game_name=None, status=None, free_slots=False, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+        """
+        依房號排序取一頁符合條件的房間；cursor 是上一頁回傳的 next_cursor (房號)
+        free_slots：只列出人數未滿 (少於建立時遊戲設定的 max_players) 的房間
+        """
+        if not isinstance(page_size, int) or page_size <= 0:
+            page_size = DEFAULT_PAGE_SIZE
+        page_size = min(page_size, MAX_PAGE_SIZE)
+        try:
+            after = int(cursor) if cursor is not None else None
+        except (TypeError, ValueError):
+            return {'status': 'fail', 'message': 'Invalid cursor'}
+
+        with self._lock:
+            # 有條件時從最小的索引集合開始取交集，不必看過所有房間
+            sets = []
+            if game_name is not None:
+                sets.append(self._by_game.get(game_name, set()))
+            if status is not None:
+                sets.append(self._by_status.get(status, set()))
+            if sets:
+                sets.sort(key=len)
+                ids = sorted(int(rid) for rid in sets[0].intersection(*sets[1:]))
+            else:
+                ids = [int(rid) for rid in self._summaries] # 房號遞增，插入順序就是排序
+            start = bisect.bisect_right(ids, after) if after is not None else 0
+
+            page = {}
+            last = next_cursor = None
+            for i in range(start, len(ids)):
+                rid = str(ids[i])
+                s = self._summaries[rid]
+                if free_slots and len(s['players']) >= s['max_players']: continue
+                if len(page) == page_size:
+                    # 後面還有符合條件的房間
+                    next_cursor = last
+                    break
+                page[rid] = s
+                last = rid
+            return {'status': 'success', 'rooms': page, 'next_cursor': next_cursor}
@@ -3,437 +3,825 @@ import threading
 import sys
 import os
 import json
-import subprocess
 import uuid
 import zipfile
-import random
 import time
 import argparse
+import signal
+import asyncio
+import queue
+import shutil
+from concurrent.futures import ThreadPoolExecutor, wait
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from common.utils import send_json, recv_json, recv_file, send_file
+from common import metrics
+from common import async_utils as aio
+from server.storage import JsonStore, SqliteStore, SAVE_DELAY, COMPACT_EVERY
+from server.catalog import Catalog, DEFAULT_PAGE_SIZE
+from server.rooms import RoomRegistry, DEFAULT_PAGE_SIZE as ROOM_PAGE_SIZE
+from server.worker_pool import WorkerPool, WARM_WORKERS
+from server.ports import PortAllocator, GAME_PORT_START, GAME_PORT_END
+from common.utils import send_json, recv_json, recv_message, recv_file, send_file, file_sha256, choose_codec, set_codec, choose_compression, set_compression, enable_nodelay, FEATURES
 
 # 預設值，會被 args 覆蓋
 HOST = '0.0.0.0' 
 PORT = 5555
 PUBLIC_HOST = '127.0.0.1'
 MAX_ROOMS = 100
+CONN_WORKERS = 4 # 每條連線可同時處理的請求數
+SESSION_SHARDS = 16
+REVIEW_PAGE_SIZE = 10
+MAX_REVIEW_PAGE_SIZE = 50
+
+# 會改變連線狀態 (登入身分) 的指令，不能與其他請求並行；收送檔案的指令 (transfer=True) 同樣依序執行
+SERIAL_COMMANDS = {'LOGIN', 'LOGOUT'}
+ASYNC_BACKLOG = 1024
 
 DB_FILE = 'server/db.json'
 STORAGE_DIR = 'server/server_data'
-
-db_lock = threading.Lock()
-
-data_store = {
-    "developers": {}, 
-    "players": {},    
-    "games": {},      
-    "rooms": {},
-    "user_history": {}
-}
-online_users = set()
-
-def pick_free_port(start=10000, end=20000) -> int:
-    for _ in range(50):
-        p = random.randint(start, end)
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            try:
-                s.bind(('', p))
-                return p
-            except OSError:
-                continue
-    raise RuntimeError("No free port found")
-
-def load_data():
-    global data_store
-    if os.path.exists(DB_FILE):
+STATS_FILE = 'server/stats.json'
+JOURNAL_FILE = 'server/db.journal'
+SQLITE_FILE = 'server/db.sqlite3'
+
+store = None # JsonStore / SqliteStore，啟動時由 --storage 決定
+catalog = None # 商城目錄 (摘要、排序索引、版本號)
+
+class SessionRegistry:
+    """線上使用者 ("role:name" → Session)，依 hash 分到多個 shard，各 shard 各自上鎖"""
+    def __init__(self, shards=SESSION_SHARDS):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def add(self, key, session):
+        """登記成功回傳 True；已經有人以此帳號登入則回傳 False"""
+        users, lock = self._shard(key)
+        with lock:
+            if key in users:
+                return False
+            users[key] = session
+            return True
+
+    def remove(self, key, session):
+        users, lock = self._shard(key)
+        with lock:
+            if users.get(key) is session:
+                del users[key]
+                return True
+            return False
+
+    def __contains__(self, key):
+        users, lock = self._shard(key)
+        with lock:
+            return key in users
+
+    def keys(self):
+        result = []
+        for users, lock in self._shards:
+            with lock:
+                result.extend(users)
+        return result
+
+rooms = RoomRegistry(MAX_ROOMS)
+workers = WorkerPool() # 預先啟動的遊戲 server 行程
+ports = PortAllocator() # 遊戲 server 的 port，啟動時依 --game_ports 重建
+online_users = SessionRegistry()
+
+def open_store(kind, save_delay=SAVE_DELAY, compact_every=COMPACT_EVERY):
+    global store, catalog
+    if kind == 'sqlite':
+        store = SqliteStore(SQLITE_FILE)
+        store.load()
+        if store.is_empty() and os.path.exists(DB_FILE):
+            legacy = JsonStore(DB_FILE, JOURNAL_FILE)
+            legacy.load()
+            count = store.import_json(legacy)
+            print(f"[DB] Imported {DB_FILE} into {SQLITE_FILE} ({count} games).")
+    else:
+        store = JsonStore(DB_FILE, JOURNAL_FILE, save_delay, compact_every)
+        store.load()
+    store.start()
+    catalog = Catalog(store)
+    catalog.load()
+    os.makedirs(STORAGE_DIR, exist_ok=True)
+
+class Session:
+    """一條 client 連線的登入狀態，threaded 與 event-loop 兩種模式共用"""
+    def __init__(self, addr):
+        self.addr = addr
+        self.user = None
+        self.role = None
+        self.push = None # 由傳輸模式設定：把一則事件排進這條連線的送出佇列，不可阻塞
+
+def cleanup_session(session):
+    user, role = session.user, session.role
+    session.user = None
+    session.role = None
+    if not user or not role: return
+    
+    # 1. 從線上名單移除 (使用正確的 session_id)
+    session_id = f"{role}:{user}"
+    if online_users.remove(session_id, session):
+        print(f"[LOGOUT] {session_id} removed from online list.")
+
+    # 2. 從所在的房間移除 (僅限玩家)
+    if role == 'player':
+        for room in rooms.rooms_of(user):
+            # 如果房間空了，刪除房間
+            if leave_room(room, user):
+                print(f"[Auto-Clean] Room {room.rid} deleted.")
+
+def get_room(rid):
+    return rooms.get(rid)
+
+def leave_room(room, user):
+    """把 user 移出房間 (房主離開時交給下一位)；房間因此變空並被刪除時回傳 True"""
+    with room.lock:
+        if room.closed or user not in room.players:
+            return False
+        room.subscribers.pop(user, None)
+        if rooms.remove_player(room, user):
+            return True
+        room.publish('left', user=user)
+        if user == room.host:
+            room.host = room.players[0]
+            rooms.changed(room)
+            room.publish('host', host=room.host)
+        return False
+
+# === 指令註冊表 ===
+
+class CommandHandler:
+    """一個大廳指令：處理函式 + 登入/角色需求 + 延遲與錯誤統計"""
+    def __init__(self, name, func, login=False, role=None, denied=None, blocking=False, transfer=False):
+        self.name = name
+        self.func = func
+        self.login = login or role is not None
+        self.role = role
+        self.denied = denied or 'Login required'
+        # transfer：直接在連線上收送檔案，處理函式多收一個 transfer 參數 (見「上傳 / 下載」)
+        self.transfer = transfer
+        # event-loop 模式下交給 thread pool 執行；收送檔案要等待 client，也一樣
+        self.blocking = blocking or transfer
+        self.latency = metrics.LatencyHistogram()
+        self.errors = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allowed(self, session):
+        if self.login and not session.user:
+            return False
+        return self.role is None or session.role == self.role
+
+    def __call__(self, session, payload, transfer=None):
+        if not self.allowed(session):
+            with self._lock:
+                self.rejected += 1
+            return {'status': 'fail', 'message': self.denied}
+        start = time.perf_counter()
+        ok = False
         try:
-            with open(DB_FILE, 'r') as f:
-                content = f.read()
-                if content:
-                    loaded = json.loads(content)
-                    if "developers" not in loaded: loaded["developers"] = {}
-                    if "players" not in loaded: loaded["players"] = {}
-                    if "user_history" not in loaded: loaded["user_history"] = {}
-                    data_store = loaded
-        except Exception as e:
-            print(f"[Warning] DB load failed: {e}, using empty DB")
-    if not os.path.exists(STORAGE_DIR):
-        os.makedirs(STORAGE_DIR)
-    data_store['rooms'] = {}
+            response = self.func(session, payload, transfer) if self.transfer else self.func(session, payload)
+            ok = True
+            return response
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.latency.observe(elapsed_ms)
+                if not ok:
+                    self.errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            entry = {'errors': self.errors, 'rejected': self.rejected}
+            entry.update(self.latency.snapshot())
+        return entry
+
+COMMANDS = {}
+
+def command(name, **options):
+    """註冊指令：@command('CREATE_ROOM', role='player', denied='Login as Player required')"""
+    def decorator(func):
+        COMMANDS[name] = CommandHandler(name, func, **options)
+        return func
+    return decorator
+
+def is_blocking(cmd):
+    handler = COMMANDS.get(cmd)
+    return handler is not None and handler.blocking
+
+def is_transfer(cmd):
+    handler = COMMANDS.get(cmd)
+    return handler is not None and handler.transfer
+
+def process_command(session, cmd, payload, transfer=None):
+    """
+    處理一個指令，回傳要送回的 response (None 表示處理函式已自行回覆)
+    transfer 由傳輸模式提供，只傳給收送檔案的指令
+    """
+    handler = COMMANDS.get(cmd)
+    if handler is None:
+        return {'status': 'error', 'message': 'Unknown command'}
+    try:
+        return handler(session, payload, transfer)
+    except Exception as inner_e:
+        print(f"[Error processing command {cmd}]: {inner_e}")
+        return {'status': 'error', 'message': 'Internal Server Error'}
+
+def command_stats():
+    """各指令的呼叫次數、延遲分佈、例外與權限拒絕次數"""
+    return {name: h.snapshot() for name, h in sorted(COMMANDS.items()) if h.latency.count or h.rejected}
+
+# === 帳號 ===
+
+@command('LOGIN')
+def cmd_login(session, payload):
+    username = payload.get('username', '').strip()
+    password = payload.get('password', '').strip()
+    role = payload.get('role', 'player')
+
+    session_id = f"{role}:{username}"
+
+    if not username or not password:
+        response = {'status': 'fail', 'message': 'Empty username or password'}
+    elif session_id in online_users:
+        response = {'status': 'fail', 'message': f'Account ({role}) already logged in elsewhere.'}
+    else:
+        stored = store.get_password(role, username)
+
+        if stored is None:
+            store.add_user(role, username, password)
+            response = {'status': 'success', 'message': f'Registered as {role} and Logged in'}
+        elif stored == password:
+            response = {'status': 'success', 'message': f'Logged in as {role}'}
+        else:
+            response = {'status': 'fail', 'message': 'Wrong password'}
+
+    if response['status'] == 'success' and not online_users.add(session_id, session):
+        # 同一帳號的兩個登入請求同時通過檢查，只有先登記的算數
+        response = {'status': 'fail', 'message': f'Account ({role}) already logged in elsewhere.'}
+
+    if response['status'] == 'success':
+        session.user = username
+        session.role = role
+        # 協商之後的編碼 (舊版 client 不會帶 codecs，維持 JSON)
+        response['codec'] = choose_codec(payload.get('codecs'))
+        response['compression'] = choose_compression(payload.get('compression'))
+        response['features'] = FEATURES
+    return response
+
+@command('LOGOUT')
+def cmd_logout(session, payload):
+    cleanup_session(session)
+    return {'status': 'success'}
+
+@command('LIST_USERS')
+def cmd_list_users(session, payload):
+    # 顯示純名字，隱藏 role 前綴
+    display_list = [sid.split(':')[1] for sid in online_users.keys()]
+    return {'status': 'success', 'users': display_list}
+
+# === 商城 ===
+
+@command('REMOVE_GAME', role='developer', denied='Permission denied: Developer only')
+def cmd_remove_game(session, payload):
+    game_name = payload.get('game_name')
+    g = store.get_game(game_name)
+    if g is None:
+        return {'status': 'fail', 'message': 'Game not found'}
+    if g['author'] != session.user:
+        return {'status': 'fail', 'message': 'Permission denied: Not your game'}
+    store.remove_game(game_name)
+    catalog.refresh(game_name)
+    return {'status': 'success', 'message': 'Game removed'}
+
+@command('LIST_GAMES')
+def cmd_list_games(session, payload):
+    return catalog.list_reply(payload.get('catalog_version'))
+
+@command('QUERY_GAMES')
+def cmd_query_games(session, payload):
+    """分頁 / 排序 / 篩選的商城查詢，參數見 Catalog.query"""
+    min_players = payload.get('min_players')
+    return catalog.query(
+        sort=payload.get('sort', 'rating'),
+        cursor=payload.get('cursor'),
+        page_size=payload.get('page_size', DEFAULT_PAGE_SIZE),
+        game_type=payload.get('game_type'),
+        min_players=min_players if isinstance(min_players, int) else None,
+        author=payload.get('author'),
+        client_version=payload.get('catalog_version')
+    )
+
+@command('GET_GAME_DETAILS')
+def cmd_get_game_details(session, payload):
+    name = payload.get('game_name')
+    g = store.get_game(name)
+    if g is None:
+        return {'status': 'fail', 'message': 'Game not found'}
+    # 只附上評分統計與最新一頁評論，其餘由 LIST_REVIEWS 往下翻
+    reviews, cursor = store.review_page(name, limit=REVIEW_PAGE_SIZE)
+    return {'status': 'success', 'game': {
+        'name': name, 'version': g['version'], 'author': g['author'],
+        'description': g['description'], 'reviews': reviews, 'reviews_cursor': cursor,
+        'rating': store.get_rating(name),
+        'min_players': g.get('min_players', 1),
+        'game_type': g.get('game_type', 'GUI')
+    }}
+
+@command('LIST_REVIEWS')
+def cmd_list_reviews(session, payload):
+    """由新到舊的評論分頁；cursor 是上一頁回傳的 next_cursor"""
+    name = payload.get('game_name')
+    cursor = payload.get('cursor')
+    page_size = payload.get('page_size', REVIEW_PAGE_SIZE)
+    if cursor is not None and (not isinstance(cursor, int) or cursor < 0):
+        return {'status': 'fail', 'message': 'Invalid cursor'}
+    if not isinstance(page_size, int) or page_size <= 0:
+        page_size = REVIEW_PAGE_SIZE
+    if not store.has_game(name):
+        return {'status': 'fail', 'message': 'Game not found'}
+    reviews, next_cursor = store.review_page(name, cursor, min(page_size, MAX_REVIEW_PAGE_SIZE))
+    return {'status': 'success', 'reviews': reviews, 'next_cursor': next_cursor}
+
+@command('RATE_GAME', role='player', denied='Only players can rate')
+def cmd_rate_game(session, payload):
+    name = payload.get('game_name')
+    score = payload.get('score')
+    comment = payload.get('comment', '')
+
+    if not isinstance(score, int) or not (1 <= score <= 5):
+        return {'status': 'fail', 'message': 'Score must be 1-5'}
+    if len(comment) > 50:
+        return {'status': 'fail', 'message': 'Comment too long'}
+    if not store.has_played(session.user, name):
+        return {'status': 'fail', 'message': 'You must play this game before rating!'}
+    if not store.has_game(name):
+        return {'status': 'fail', 'message': 'Game not found'}
+    review = {
+        'user': session.user,
+        'score': score,
+        'comment': comment,
+        'time': time.time()
+    }
+    store.add_review(name, review)
+    catalog.refresh(name)
+    return {'status': 'success', 'message': 'Review added'}
+
+# === 房間 ===
+
+ROOM_QUERY_KEYS = ('game_name', 'status', 'free_slots', 'cursor', 'page_size')
+
+@command('LIST_ROOMS')
+def cmd_list_rooms(session, payload):
+    """
+    不帶條件時回傳完整的房間列表 (舊版 client)
+    帶 game_name / status ('waiting' / 'playing') / free_slots / cursor / page_size 時依房號分頁查詢
+    """
+    if not any(key in payload for key in ROOM_QUERY_KEYS):
+        return rooms.list_reply()
+    status = payload.get('status')
+    if status not in (None, 'waiting', 'playing'):
+        return {'status': 'fail', 'message': f'Unknown status: {status}'}
+    return rooms.query(
+        game_name=payload.get('game_name') or None,
+        status=status,
+        free_slots=bool(payload.get('free_slots')),
+        cursor=payload.get('cursor'),
+        page_size=payload.get('page_size', ROOM_PAGE_SIZE)
+    )
+
+@command('CREATE_ROOM', role='player', denied='Login as Player required')
+def cmd_create_room(session, payload):
+    name = payload.get('game_name')
+    g_info = store.get_game(name)
+    if g_info is None:
+        return {'status': 'fail', 'message': 'Game has been removed or not found'}
+    room = rooms.create(session.user, name, g_info.get('max_players', 100))
+    if room is None:
+        return {'status': 'fail', 'message': 'Server room limit reached'}
+    # 趁玩家還在房間等待時先準備好遊戲 server 行程
+    if workers.size > 0:
+        threading.Thread(target=warm_game, args=(name, g_info), daemon=True).start()
+    return {'status': 'success', 'room_id': room.rid}
+
+@command('LOBBY_CHAT')
+def cmd_lobby_chat(session, payload):
+    rid = payload.get('room_id')
+    msg = payload.get('message', '')
+    room = get_room(rid)
+    if room is None or not session.user:
+        return {'status': 'fail', 'message': 'Room not found'}
+    chat_entry = f"[{session.user}]: {msg}"
+    with room.lock:
+        chat_seq = room.add_chat(chat_entry)
+        room.publish('chat', line=chat_entry, chat_seq=chat_seq)
+    return {'status': 'success', 'chat_seq': chat_seq}
+
+@command('JOIN_ROOM', role='player', denied='Login as Player required')
+def cmd_join_room(session, payload):
+    rid = payload.get('room_id')
+    room = get_room(rid)
+    if room is None:
+        return {'status': 'fail', 'message': 'Room not found'}
+    with room.lock:
+        if room.closed:
+            return {'status': 'fail', 'message': 'Room not found'}
+        if room.status == 'playing' or room.starting:
+            return {'status': 'fail', 'message': 'Game started'}
+        if session.user not in room.players:
+            rooms.add_player(room, session.user)
+            room.publish('joined', user=session.user)
+    return {'status': 'success', 'room_id': rid, 'game_name': room.game_name}
+
+def chat_cursor(payload):
+    """client 已收到的最後一行聊天序號；舊版 client 不帶，回傳完整的聊天紀錄"""
+    since = payload.get('chat_since')
+    return since if isinstance(since, int) and since > 0 else None
+
+@command('GET_ROOM_INFO')
+def cmd_get_room_info(session, payload):
+    rid = payload.get('room_id')
+    r = get_room(rid)
+    if r is None:
+        return {'status': 'fail', 'message': 'Room closed'}
+    with r.lock:
+        return r.snapshot(PUBLIC_HOST, chat_cursor(payload))
+
+@command('SUBSCRIBE_ROOM', role='player', denied='Login as Player required')
+def cmd_subscribe_room(session, payload):
+    """
+    回傳房間快照 (同 GET_ROOM_INFO)，之後房間有變動時 server 主動推送 ROOM_EVENT：
+    joined / left / host / chat / status；序號不大於快照 seq 的事件已包含在快照中
+    離開房間 (或斷線) 時自動取消訂閱
+    """
+    room = get_room(payload.get('room_id'))
+    if room is None or session.push is None:
+        return {'status': 'fail', 'message': 'Room closed'}
+    with room.lock:
+        if room.closed:
+            return {'status': 'fail', 'message': 'Room closed'}
+        if session.user not in room.players:
+            return {'status': 'fail', 'message': 'Not in room'}
+        room.subscribers[session.user] = session.push
+        return room.snapshot(PUBLIC_HOST, chat_cursor(payload))
+
+@command('UNSUBSCRIBE_ROOM', role='player', denied='Login as Player required')
+def cmd_unsubscribe_room(session, payload):
+    room = get_room(payload.get('room_id'))
+    if room is not None:
+        with room.lock:
+            room.subscribers.pop(session.user, None)
+    return {'status': 'success'}
+
+@command('LEAVE_ROOM')
+def cmd_leave_room(session, payload):
+    room = get_room(payload.get('room_id'))
+    if room is not None:
+        leave_room(room, session.user)
+    return {'status': 'success'}
+
+@command('START_GAME', blocking=True)
+def cmd_start_game(session, payload):
+    rid = payload.get('room_id')
+    room = get_room(rid)
+    if room is None:
+        return {'status': 'fail', 'message': 'Room not found'}
+    game_name = room.game_name
+
+    # 記錄遊玩歷史
+    with room.lock:
+        players = list(room.players)
+    for p_name in players:
+        store.add_history(p_name, game_name)
+
+    # 解壓與啟動子行程較慢，只在檢查與切換狀態時持有房間的鎖
+    with room.lock:
+        if session.user != room.host:
+            return {'status': 'fail', 'message': 'Only host can start'}
+        if room.closed:
+            return {'status': 'fail', 'message': 'Room not found'}
+        if room.starting:
+            return {'status': 'fail', 'message': 'Game is starting'}
+        room.starting = True
+        player_count = len(room.players)
+    try:
+        g_info = store.get_game(game_name)
+        if g_info is None:
+            return {'status': 'fail', 'message': 'Game has been removed or not found'}
+
+        max_p = g_info.get('max_players', 100) # 若舊資料無此欄位，給寬鬆預設值
+        if player_count > max_p:
+            return {'status': 'fail', 'message': f'人數過多！此遊戲最多支援 {max_p} 人'}
+
+        target, cfg = prepare_game(game_name, g_info)
+        script = cfg['server']['script']
 
-def save_data():
-    with db_lock:
+        port = ports.lease(rid)
         try:
-            with open(DB_FILE, 'w') as f:
-                save_dict = {
-                    "developers": data_store.get("developers", {}),
-                    "players": data_store.get("players", {}),
-                    "user_history": data_store.get("user_history", {}),
-                    "games": data_store.get("games", {}),
-                    "rooms": {} 
-                }
-                json.dump(save_dict, f, indent=4)
-        except Exception as e:
-            print(f"[Error] Save DB failed: {e}")
+            # 到遊戲 server 啟動為止的任何錯誤 (例如 args_template 有未知的欄位) 都要歸還 port
+            token = uuid.uuid4().hex[:16]
+            args = cfg['server']['args_template'].format(
+                port=port, token=token, room_id=rid,
+                lobby_host=PUBLIC_HOST, lobby_port=PORT
+            ).split()
+            proc = workers.launch(game_name, target, script, args)
+        except Exception:
+            ports.release(port)
+            raise
+        ports.attach(port, proc) # 遊戲 server 結束後收回 port
+        workers.warm(game_name, target, script) # 補回剛用掉的閒置行程
+        with room.lock:
+            room.status = 'playing'
+            room.port = port
+            room.token = token
+            rooms.changed(room)
+            room.publish('status', status='playing', game_host=PUBLIC_HOST, game_port=port, token=token)
+        return {'status': 'success'}
+    except Exception as e:
+        print(f"Start Game Error: {e}")
+        return {'status': 'fail', 'message': f"Launch failed: {str(e)}"}
+    finally:
+        with room.lock:
+            room.starting = False
+
+@command('END_REPORT')
+def cmd_end_report(session, payload):
+    """遊戲 server 在比賽結束時回報 (訊息以 type 而非 command 標示，內容直接放在最上層)"""
+    print(f"[END_REPORT] room {payload.get('roomId')} ended: {payload.get('reason')} (winner: {payload.get('winner')})")
+    # 行程結束後 port 才真的空出來；先收回已經結束的比賽
+    ports.reap()
+    return {'status': 'success'}
+
+def prepare_game(game_name, g_info):
+    """解壓遊戲 (每個版本只做一次) 並讀取設定，回傳 (執行目錄, config)"""
+    extract_dir = os.path.join(os.path.dirname(g_info['path']), f"extracted_{g_info['version']}")
+    if not os.path.exists(extract_dir):
+        # 先解壓到暫存目錄再改名，同時開局 / 預熱的請求不會讀到解壓一半的檔案
+        tmp_dir = f"{extract_dir}.{uuid.uuid4().hex[:8]}.tmp"
+        with zipfile.ZipFile(g_info['path'], 'r') as zf: zf.extractall(tmp_dir)
+        try:
+            os.rename(tmp_dir, extract_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True) # 其他請求已經解壓好了
+
+    target = extract_dir
+    nested = os.path.join(extract_dir, game_name)
+    if os.path.exists(nested) and os.path.exists(os.path.join(nested, 'config.json')):
+        target = nested
+
+    with open(os.path.join(target, 'config.json')) as f:
+        cfg = json.load(f)
+    return target, cfg
+
+def warm_game(game_name, g_info):
+    try:
+        target, cfg = prepare_game(game_name, g_info)
+        workers.warm(game_name, target, cfg['server']['script'])
+    except Exception as e:
+        print(f"[Worker Pool] Prewarm {game_name} failed: {e}")
+
+def apply_negotiation(conn, cmd, response):
+    # 登入回覆本身仍以舊編碼送出，之後才切換
+    if cmd == 'LOGIN' and 'codec' in response:
+        set_codec(conn, response['codec'])
+        set_compression(conn, response['compression'])
+
+# === 上傳 / 下載 ===
+# 這兩個指令直接在連線上收送檔案，處理函式多收一個 transfer (ThreadedTransfer / AsyncTransfer)：
+#   send(data)                        回覆一則訊息 (帶原請求的 req_id)
+#   recv_json()                       讀取 client 接著送來的訊息
+#   recv_file(path, size)             收檔案
+#   send_file(data, path, off, len)   回覆 data 後緊接著送出檔案內容，中間不會插入其他訊息
+
+@command('UPLOAD_GAME_INIT', role='developer', denied='Permission denied: Developer only', transfer=True)
+def cmd_upload_game(session, payload, transfer):
+    game_name = payload.get('game_name')
+    version = payload.get('version', '1.0')
+    save_path = os.path.join(STORAGE_DIR, game_name, f"{version}.zip")
+    transfer.send({'status': 'ready_to_receive'})
+    file_info = transfer.recv_json()
+    if not file_info:
+        return {'status': 'fail', 'message': 'File info missing'}
+    if not transfer.recv_file(save_path, file_info['size']):
+        return {'status': 'fail', 'message': 'File receive failed'}
+
+    store.put_game(game_name, {
+        'author': session.user,
+        'version': version,
+        'description': payload.get('desc', ''),
+        'path': save_path,
+        'min_players': payload.get('min_players', 1),
+        'max_players': payload.get('max_players', 4),
+        'game_type': payload.get('game_type', 'GUI'),
+        'sha256': file_sha256(save_path),
+        'updated': time.time()
+    })
+    catalog.refresh(game_name)
+    return {'status': 'success', 'message': 'Upload complete'}
+
+@command('DOWNLOAD_GAME_INIT', transfer=True)
+def cmd_download_game(session, payload, transfer):
+    name = payload.get('game_name')
+    g = store.get_game(name)
+    if g is None:
+        return {'status': 'fail', 'message': 'Game not found'}
+    path = g['path']
+    total = os.path.getsize(path)
+    if 'sha256' not in g:
+        g['sha256'] = file_sha256(path) # 舊資料沒有雜湊，第一次下載時補算
+        store.set_sha256(name, g['sha256'])
+    # 斷點續傳：client 帶上已下載的位置與當時的雜湊；版本已變則從頭開始
+    offset = payload.get('offset', 0)
+    if not isinstance(offset, int) or payload.get('sha256') != g['sha256']:
+        offset = 0
+    offset = max(0, min(offset, total))
+    length = payload.get('length')
+    if not isinstance(length, int) or length < 0 or length > total - offset:
+        length = total - offset
+    ready = {
+        'status': 'ready_to_send', 'offset': offset, 'length': length,
+        'total': total, 'sha256': g['sha256']
+    }
+    transfer.send_file(ready, path, offset, length)
+    return None
+
+class ThreadedTransfer:
+    """threaded 模式：直接在連線的 socket 上收送；送出時持有連線的送出鎖"""
+    def __init__(self, conn, send_lock, req_id, tag):
+        self.conn = conn
+        self.send_lock = send_lock
+        self.req_id = req_id
+        self.tag = tag
+
+    def send(self, data):
+        with self.send_lock:
+            return send_json(self.conn, data, req_id=self.req_id, tag=self.tag)
+
+    def recv_json(self):
+        return recv_json(self.conn)
+
+    def recv_file(self, path, size):
+        return recv_file(self.conn, path, size, tag=self.tag)
+
+    def send_file(self, data, path, offset, length):
+        # 檔案內容是 raw bytes，傳輸期間不能被其他回覆插隊
+        with self.send_lock:
+            return (send_json(self.conn, data, req_id=self.req_id, tag=self.tag)
+                    and send_file(self.conn, path, offset, length, tag=self.tag))
+
+class AsyncTransfer:
+    """event-loop 模式：處理函式在 thread pool 中執行，收送交回 event loop 進行並等待結果"""
+    def __init__(self, loop, reader, writer, req_id, tag):
+        self.loop = loop
+        self.reader = reader
+        self.writer = writer
+        self.req_id = req_id
+        self.tag = tag
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def send(self, data):
+        return self._run(aio.send_json(self.writer, data, req_id=self.req_id, tag=self.tag))
+
+    def recv_json(self):
+        return self._run(aio.recv_json(self.reader, aio.get_compression(self.writer)))
+
+    def recv_file(self, path, size):
+        return self._run(aio.recv_file(self.reader, path, size, tag=self.tag))
+
+    def send_file(self, data, path, offset, length):
+        return self._run(self._send_file(data, path, offset, length))
+
+    async def _send_file(self, data, path, offset, length):
+        return (await aio.send_json(self.writer, data, req_id=self.req_id, tag=self.tag)
+                and await aio.send_file(self.writer, path, offset, length, tag=self.tag))
+
+# === Threaded 模式：每條連線一個 thread ===
 
 def handle_client(conn, addr):
     print(f"[NEW CONNECTION] {addr} connected.")
-    current_user = None
-    current_role = None 
-
-    def cleanup_user_session(user, role):
-        if not user or not role: return
-        
-        # 1. 從線上名單移除 (使用正確的 session_id)
-        session_id = f"{role}:{user}"
-        if session_id in online_users:
-            online_users.discard(session_id)
-            print(f"[LOGOUT] {session_id} removed from online list.")
-
-        # 2. 從所有房間移除 (僅限玩家)
-        if role == 'player':
-            for rid in list(data_store['rooms'].keys()):
-                if rid in data_store['rooms']:
-                    room = data_store['rooms'][rid]
-                    if user in room['players']:
-                        room['players'].remove(user)
-                        # 如果房間空了，刪除房間
-                        if not room['players']:
-                            del data_store['rooms'][rid]
-                            print(f"[Auto-Clean] Room {rid} deleted.")
+    session = Session(addr)
+    send_lock = threading.Lock()
+
+    def reply(response, req_id=None, tag=None):
+        with send_lock:
+            return send_json(conn, response, req_id=req_id, tag=tag)
+
+    # 房間事件由獨立的 thread 送出，發布端 (持有房間的鎖) 只需放進佇列
+    events = queue.SimpleQueue()
+    def pusher():
+        while True:
+            event = events.get()
+            if event is None: return
+            reply(event, tag='ROOM_EVENT')
+    threading.Thread(target=pusher, daemon=True).start()
+    session.push = events.put
+
+    def run_and_reply(cmd, payload, req_id):
+        transfer = ThreadedTransfer(conn, send_lock, req_id, cmd) if is_transfer(cmd) else None
+        response = process_command(session, cmd, payload, transfer)
+        if response is not None:
+            reply(response, req_id, tag=cmd)
+            apply_negotiation(conn, cmd, response)
+
+    # 帶 req_id 的請求可以並行處理；會改變連線狀態或直接收送檔案的指令仍依序執行
+    executor = ThreadPoolExecutor(max_workers=CONN_WORKERS)
+    in_flight = set()
 
     try:
         while True:
-            request = recv_json(conn)
+            req_id, request = recv_message(conn)
             if not request:
                 break
             
             cmd = request.get('command')
             payload = request.get('payload', {})
-            response = {'status': 'error', 'message': 'Unknown command'}
+            if cmd is None and request.get('type') == 'END_REPORT':
+                cmd, payload = 'END_REPORT', request
 
-            try:
-                if cmd == 'LOGIN':
-                    username = payload.get('username', '').strip()
-                    password = payload.get('password', '').strip()
-                    role = payload.get('role', 'player') 
-                    
-                    session_id = f"{role}:{username}"
-
-                    if not username or not password:
-                        response = {'status': 'fail', 'message': 'Empty username or password'}
-                    elif session_id in online_users:
-                        response = {'status': 'fail', 'message': f'Account ({role}) already logged in elsewhere.'}
-                    else:
-                        target_db = data_store["developers"] if role == 'developer' else data_store["players"]
-                        
-                        if username not in target_db:
-                            target_db[username] = password
-                            response = {'status': 'success', 'message': f'Registered as {role} and Logged in'}
-                        elif target_db[username] == password:
-                            response = {'status': 'success', 'message': f'Logged in as {role}'}
-                        else:
-                            response = {'status': 'fail', 'message': 'Wrong password'}
-                    
-                    if response['status'] == 'success':
-                        current_user = username
-                        current_role = role
-                        online_users.add(session_id)
-                        save_data()
-
-                elif cmd == 'LOGOUT':
-                    cleanup_user_session(current_user, current_role)
-                    current_user = None
-                    current_role = None
-                    response = {'status': 'success'}
-
-                elif cmd == 'LIST_USERS':
-                    # 顯示純名字，隱藏 role 前綴
-                    display_list = [sid.split(':')[1] for sid in online_users]
-                    response = {'status': 'success', 'users': display_list}
-
-                elif cmd == 'UPLOAD_GAME_INIT':
-                    if not current_user or current_role != 'developer':
-                        response = {'status': 'fail', 'message': 'Permission denied: Developer only'}
-                    else:
-                        game_name = payload.get('game_name')
-                        version = payload.get('version', '1.0')
-                        min_p = payload.get('min_players', 1)
-                        max_p = payload.get('max_players', 4)
-                        g_type = payload.get('game_type', 'GUI') 
-                        desc = payload.get('desc', '')
-
-                        send_json(conn, {'status': 'ready_to_receive'})
-                        file_info = recv_json(conn)
-                        if file_info:
-                            game_dir = os.path.join(STORAGE_DIR, game_name)
-                            os.makedirs(game_dir, exist_ok=True)
-                            save_path = os.path.join(game_dir, f"{version}.zip")
-                            if recv_file(conn, save_path, file_info['size']):
-                                old_reviews = data_store['games'].get(game_name, {}).get('reviews', [])
-                                data_store['games'][game_name] = {
-                                    'author': current_user,
-                                    'version': version,
-                                    'description': desc,
-                                    'path': save_path,
-                                    'reviews': old_reviews,
-                                    'min_players': min_p,
-                                    'max_players': max_p, 
-                                    'game_type': g_type
-                                }
-                                save_data()
-                                response = {'status': 'success', 'message': 'Upload complete'}
-                            else:
-                                response = {'status': 'fail', 'message': 'File receive failed'}
-                        else:
-                            response = {'status': 'fail', 'message': 'File info missing'}
-
-                elif cmd == 'REMOVE_GAME':
-                    if not current_user or current_role != 'developer':
-                        response = {'status': 'fail', 'message': 'Permission denied: Developer only'}
-                    else:
-                        game_name = payload.get('game_name')
-                        if game_name in data_store['games']:
-                            if data_store['games'][game_name]['author'] == current_user:
-                                del data_store['games'][game_name]
-                                save_data()
-                                response = {'status': 'success', 'message': 'Game removed'}
-                            else:
-                                response = {'status': 'fail', 'message': 'Permission denied: Not your game'}
-                        else:
-                            response = {'status': 'fail', 'message': 'Game not found'}
-
-                elif cmd == 'LIST_GAMES':
-                    summary = {}
-                    for name, info in data_store['games'].items():
-                        reviews = info.get('reviews', [])
-                        avg = sum(r['score'] for r in reviews)/len(reviews) if reviews else 0
-                        summary[name] = {
-                            'version': info['version'], 
-                            'author': info['author'],
-                            'description': info['description'], 
-                            'rating': round(avg, 1),
-                            'min_players': info.get('min_players', 1),
-                            'game_type': info.get('game_type', 'GUI')
-                        }
-                    response = {'status': 'success', 'games': summary}
-
-                elif cmd == 'GET_GAME_DETAILS':
-                    name = payload.get('game_name')
-                    if name in data_store['games']:
-                        g = data_store['games'][name]
-                        response = {'status': 'success', 'game': {
-                            'name': name, 'version': g['version'], 'author': g['author'],
-                            'description': g['description'], 'reviews': g.get('reviews', []),
-                            'min_players': g.get('min_players', 1),
-                            'game_type': g.get('game_type', 'GUI')
-                        }}
-                    else:
-                        response = {'status': 'fail', 'message': 'Game not found'}
-
-                elif cmd == 'RATE_GAME':
-                    if current_role != 'player':
-                         response = {'status': 'fail', 'message': 'Only players can rate'}
-                    else:
-                        name = payload.get('game_name')
-                        score = payload.get('score')
-                        comment = payload.get('comment', '')
-
-                        if not isinstance(score, int) or not (1 <= score <= 5):
-                            response = {'status': 'fail', 'message': 'Score must be 1-5'}
-                        elif len(comment) > 50:
-                            response = {'status': 'fail', 'message': 'Comment too long'}
-                        else:
-                            history = data_store.get('user_history', {}).get(current_user, [])
-                            if name not in history:
-                                response = {'status': 'fail', 'message': 'You must play this game before rating!'}
-                            elif name in data_store['games']:
-                                review = {
-                                    'user': current_user, 
-                                    'score': score, 
-                                    'comment': comment, 
-                                    'time': time.time()
-                                }
-                                data_store['games'][name].setdefault('reviews', []).append(review)
-                                save_data()
-                                response = {'status': 'success', 'message': 'Review added'}
-                            else:
-                                response = {'status': 'fail', 'message': 'Game not found'}
-
-                elif cmd == 'DOWNLOAD_GAME_INIT':
-                    name = payload.get('game_name')
-                    if name in data_store['games']:
-                        send_json(conn, {'status': 'ready_to_send'})
-                        send_file(conn, data_store['games'][name]['path'])
-                        continue 
-                    else:
-                        response = {'status': 'fail', 'message': 'Game not found'}
-
-                elif cmd == 'LIST_ROOMS':
-                    rooms_info = {}
-                    for rid in list(data_store['rooms'].keys()):
-                        r = data_store['rooms'][rid]
-                        rooms_info[rid] = {
-                            'game_name': r['game_name'], 'host': r['host'],
-                            'status': r['status'], 'players': r['players']
-                        }
-                    response = {'status': 'success', 'rooms': rooms_info}
-
-                elif cmd == 'CREATE_ROOM':
-                    if not current_user or current_role != 'player':
-                        response = {'status': 'fail', 'message': 'Login as Player required'}
-                    else:
-                        name = payload.get('game_name')
-                        if name not in data_store['games']:
-                            response = {'status': 'fail', 'message': 'Game has been removed or not found'}
-                        elif len(data_store['rooms']) >= MAX_ROOMS:
-                            response = {'status': 'fail', 'message': 'Server room limit reached'}
-                        else:
-                            rid = str(len(data_store['rooms']) + 100)
-                            data_store['rooms'][rid] = {
-                                'host': current_user, 'game_name': name,
-                                'players': [current_user], 'status': 'waiting',
-                                'port': None, 'token': None,
-                                'chat_history': [] 
-                            }
-                            response = {'status': 'success', 'room_id': rid}
-
-                elif cmd == 'LOBBY_CHAT':
-                    rid = payload.get('room_id')
-                    msg = payload.get('message', '')
-                    if rid in data_store['rooms'] and current_user:
-                        chat_entry = f"[{current_user}]: {msg}"
-                        data_store['rooms'][rid]['chat_history'].append(chat_entry)
-                        if len(data_store['rooms'][rid]['chat_history']) > 50:
-                            data_store['rooms'][rid]['chat_history'].pop(0)
-                        response = {'status': 'success'}
-                    else:
-                        response = {'status': 'fail', 'message': 'Room not found'}
-
-                elif cmd == 'JOIN_ROOM':
-                    if not current_user or current_role != 'player':
-                        response = {'status': 'fail', 'message': 'Login as Player required'}
-                    else:
-                        rid = payload.get('room_id')
-                        if rid in data_store['rooms']:
-                            room = data_store['rooms'][rid]
-                            if room['status'] == 'playing':
-                                response = {'status': 'fail', 'message': 'Game started'}
-                            else:
-                                if current_user not in room['players']:
-                                    room['players'].append(current_user)
-                                response = {'status': 'success', 'room_id': rid, 'game_name': room['game_name']}
-                        else:
-                            response = {'status': 'fail', 'message': 'Room not found'}
-
-                elif cmd == 'GET_ROOM_INFO':
-                    rid = payload.get('room_id')
-                    if rid in data_store['rooms']:
-                        r = data_store['rooms'][rid]
-                        response = {
-                            'status': 'success', 'room_status': r['status'],
-                            'players': r['players'], 'host': r['host'],
-                            'game_host': PUBLIC_HOST,
-                            'game_port': r['port'],
-                            'token': r['token'], 'game_name': r['game_name'],
-                            'chat_history': r.get('chat_history', [])
-                        }
-                    else:
-                        response = {'status': 'fail', 'message': 'Room closed'}
-
-                elif cmd == 'LEAVE_ROOM':
-                    rid = payload.get('room_id')
-                    if rid in data_store['rooms']:
-                        room = data_store['rooms'][rid]
-                        if current_user in room['players']:
-                            room['players'].remove(current_user)
-                        if not room['players']:
-                            del data_store['rooms'][rid]
-                        elif current_user == room['host']:
-                            room['host'] = room['players'][0]
-                    response = {'status': 'success'}
-
-                elif cmd == 'START_GAME':
-                    rid = payload.get('room_id')
-                    if rid in data_store['rooms']:
-                        room = data_store['rooms'][rid]
-                        game_name = room['game_name']
-                        
-                        # 記錄遊玩歷史
-                        for p_name in room['players']:
-                            if p_name not in data_store.get('user_history', {}):
-                                data_store.setdefault('user_history', {})[p_name] = []
-                            if game_name not in data_store['user_history'][p_name]:
-                                data_store['user_history'][p_name].append(game_name)
-                        save_data()
-
-                        if current_user == room['host']:
-                            try:
-                                g_info = data_store['games'][game_name]
-
-                                max_p = g_info.get('max_players', 100) # 若舊資料無此欄位，給寬鬆預設值
-                                if len(room['players']) > max_p:
-                                    response = {'status': 'fail', 'message': f'人數過多！此遊戲最多支援 {max_p} 人'}
-                                    send_json(conn, response)
-                                    continue
-                                
-                                extract_dir = os.path.join(os.path.dirname(g_info['path']), f"extracted_{g_info['version']}")
-                                if not os.path.exists(extract_dir):
-                                    with zipfile.ZipFile(g_info['path'], 'r') as zf: zf.extractall(extract_dir)
-                                
-                                target = extract_dir
-                                nested = os.path.join(extract_dir, game_name)
-                                if os.path.exists(nested) and os.path.exists(os.path.join(nested, 'config.json')):
-                                    target = nested
-                                
-                                with open(os.path.join(target, 'config.json')) as f:
-                                    cfg = json.load(f)
-                                
-                                port = pick_free_port()
-                                token = uuid.uuid4().hex[:16]
-                                cmd_list = [sys.executable, cfg['server']['script']] + \
-                                           cfg['server']['args_template'].format(
-                                               port=port, token=token, room_id=rid,
-                                               lobby_host=PUBLIC_HOST, lobby_port=PORT
-                                           ).split()
-                                
-                                subprocess.Popen(cmd_list, cwd=target)
-                                room['status'] = 'playing'
-                                room['port'] = port
-                                room['token'] = token
-                                response = {'status': 'success'}
-                            except Exception as e:
-                                print(f"Start Game Error: {e}")
-                                response = {'status': 'fail', 'message': f"Launch failed: {str(e)}"}
-                        else:
-                            response = {'status': 'fail', 'message': 'Only host can start'}
-                    else:
-                        response = {'status': 'fail', 'message': 'Room not found'}
-
-            except Exception as inner_e:
-                print(f"[Error processing command {cmd}]: {inner_e}")
-                response = {'status': 'error', 'message': 'Internal Server Error'}
-
-            send_json(conn, response)
+            if req_id is not None and cmd not in SERIAL_COMMANDS and not is_transfer(cmd):
+                in_flight.add(executor.submit(run_and_reply, cmd, payload, req_id))
+                in_flight = {f for f in in_flight if not f.done()}
+            else:
+                wait(in_flight)
+                in_flight.clear()
+                run_and_reply(cmd, payload, req_id)
 
     except Exception as e:
         print(f"[Connection Error]: {e}")
     finally:
-        cleanup_user_session(current_user, current_role)
+        executor.shutdown(wait=True)
+        cleanup_session(session)
+        events.put(None)
         conn.close()
 
-def start_server():
-    parser = argparse.ArgumentParser(description='Game Store Server')
-    parser.add_argument('--port', type=int, default=5555, help='Server listening port')
-    parser.add_argument('--public_host', type=str, default='127.0.0.1', help='Public IP address')
-    args = parser.parse_args()
+# === Event-loop 模式：單一 thread 以 asyncio 服務所有連線 ===
 
-    global PORT, PUBLIC_HOST
-    PORT = args.port
-    PUBLIC_HOST = args.public_host
+async def handle_client_async(reader, writer):
+    addr = writer.get_extra_info('peername')
+    print(f"[NEW CONNECTION] {addr} connected.")
+    session = Session(addr)
+    loop = asyncio.get_running_loop()
+    # 事件可能由 executor 中的 START_GAME 發布，一律交回 event loop 寫出
+    session.push = lambda event: loop.call_soon_threadsafe(aio.write_json, writer, event, 'ROOM_EVENT')
+
+    try:
+        while True:
+            req_id, request = await aio.recv_message(reader, aio.get_compression(writer))
+            if not request:
+                break
+
+            cmd = request.get('command')
+            payload = request.get('payload', {})
+            if cmd is None and request.get('type') == 'END_REPORT':
+                cmd, payload = 'END_REPORT', request
+
+            if is_blocking(cmd):
+                transfer = AsyncTransfer(loop, reader, writer, req_id, cmd) if is_transfer(cmd) else None
+                response = await loop.run_in_executor(None, process_command, session, cmd, payload, transfer)
+            else:
+                response = process_command(session, cmd, payload)
+
+            if response is not None:
+                await aio.send_json(writer, response, req_id=req_id, tag=cmd)
+                apply_negotiation(writer, cmd, response)
+
+    except Exception as e:
+        print(f"[Connection Error]: {e}")
+    finally:
+        cleanup_session(session)
+        writer.close()
+
+async def serve_async():
+    server = await asyncio.start_server(handle_client_async, HOST, PORT, backlog=ASYNC_BACKLOG)
+    print(f"[LISTENING] Server (event-loop mode) is listening on {HOST}:{PORT}")
+    print(f"[CONFIG] Public Host (reported to clients): {PUBLIC_HOST}")
+    print("Press Ctrl+C to stop server.")
+    async with server:
+        await server.serve_forever()
+
+def dump_stats():
+    snap = metrics.get_stats()
+    commands = command_stats()
+    try:
+        with open(STATS_FILE, 'w') as f:
+            json.dump(dict(snap, commands=commands, game_workers=workers.stats(), game_ports=ports.stats()), f, indent=4)
+    except Exception as e:
+        print(f"[Error] Save stats failed: {e}")
+    print(metrics.format_stats(snap))
+    print(f"{'command':<20} {'calls':>8} {'errors':>6} {'denied':>6} {'avg_ms':>8} {'max_ms':>8}")
+    for name, e in sorted(commands.items(), key=lambda kv: -kv[1]['count'] * kv[1]['avg_ms']):
+        print(f"{name:<20} {e['count']:>8} {e['errors']:>6} {e['rejected']:>6} {e['avg_ms']:>8} {e['max_ms']:>8}")
+
+def stats_reporter(interval):
+    while True:
+        time.sleep(interval)
+        dump_stats()
 
-    load_data()
+def serve_threaded():
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
         server.bind((HOST, PORT))
@@ -452,6 +840,7 @@ def start_server():
             try:
                 # 嘗試接受連線，若 1秒內沒人連，會噴 socket.timeout
                 conn, addr = server.accept()
+                enable_nodelay(conn)
             except socket.timeout:
                 continue # 沒人連線，回到迴圈開頭 (這時會檢查 Ctrl+C)
             
@@ -468,5 +857,55 @@ def start_server():
     
     server.close()
 
+def handle_sigterm(signum, frame):
+    # kill / 服務管理工具關閉時，與 Ctrl+C 走同一條關閉流程 (會把未存檔的修改寫入)
+    raise KeyboardInterrupt
+
+def start_server():
+    parser = argparse.ArgumentParser(description='Game Store Server')
+    parser.add_argument('--port', type=int, default=5555, help='Server listening port')
+    parser.add_argument('--public_host', type=str, default='127.0.0.1', help='Public IP address')
+    parser.add_argument('--mode', choices=['thread', 'async'], default='thread',
+                        help='thread: one thread per connection; async: single asyncio event loop')
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json',
+                        help='json: db.json + journal in memory; sqlite: server/db.sqlite3 (imports db.json on first run)')
+    parser.add_argument('--save_delay', type=float, default=SAVE_DELAY, help='Seconds to coalesce changes before appending to the journal (json storage)')
+    parser.add_argument('--compact_every', type=int, default=COMPACT_EVERY, help='Journal records before folding into a new db.json snapshot (json storage)')
+    parser.add_argument('--warm_workers', type=int, default=WARM_WORKERS,
+                        help='Idle pre-started game server processes kept per recently played game (0 disables)')
+    parser.add_argument('--game_ports', type=str, default=f'{GAME_PORT_START}-{GAME_PORT_END}',
+                        help='Port range START-END (end exclusive) leased to game servers')
+    parser.add_argument('--stats', action='store_true', help='Collect transport metrics (dumped to server/stats.json)')
+    parser.add_argument('--stats_interval', type=int, default=60, help='Seconds between stats dumps')
+    args = parser.parse_args()
+
+    global PORT, PUBLIC_HOST, ports
+    PORT = args.port
+    PUBLIC_HOST = args.public_host
+    start, end = (int(p) for p in args.game_ports.split('-'))
+    ports = PortAllocator(start, end)
+    workers.size = args.warm_workers
+
+    open_store(args.storage, args.save_delay, args.compact_every)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    if args.stats:
+        metrics.enable_stats()
+        threading.Thread(target=stats_reporter, args=(args.stats_interval,), daemon=True).start()
+
+    if args.mode == 'async':
+        try:
+            asyncio.run(serve_async())
+        except KeyboardInterrupt:
+            print("\n[SHUTDOWN] Server stopping...")
+        except OSError as e:
+            print(f"Error binding to port {PORT}: {e}")
+    else:
+        serve_threaded()
+
+    store.close()
+    workers.close()
+    if args.stats:
+        dump_stats()
+
 if __name__ == "__main__":
-    start_server()
\ No newline at end of file
+    start_server()
@@ -0,0 +1,506 @@
+"""
+大廳的持久化資料 (帳號、遊戲、評論、遊玩紀錄)
+
+兩種實作提供相同的介面，啟動時以 --storage 選擇：
+* JsonStore：整份資料放在記憶體，db.json snapshot + append-only journal
+* SqliteStore：資料放在 SQLite，記憶體用量不隨使用者 / 評論數量成長
+
+房間等連線期間的狀態不在這裡，重開 server 就會清空。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SAVE_DELAY = 0.5 # 秒，合併這段時間內的修改後才寫入 journal
+COMPACT_EVERY = 1000 # journal 累積這麼多筆就壓縮成新的 snapshot
+
+def apply_record(data, record, replay=False):
+    """
+    把一筆修改紀錄套用到 JsonStore 的資料
+    snapshot 可能已經包含部分 journal 紀錄 (壓縮時仍有請求在修改)，重播時每種操作都必須是冪等的
+    """
+    op = record['op']
+    if op == 'user':
+        target_db = data['developers'] if record['role'] == 'developer' else data['players']
+        target_db[record['name']] = record['password']
+    elif op == 'history':
+        games = data['user_history'].setdefault(record['user'], [])
+        if record['game'] not in games:
+            games.append(record['game'])
+    elif op == 'review':
+        game = data['games'].get(record['game'])
+        if game is not None:
+            reviews = game.setdefault('reviews', [])
+            if not replay or record['review'] not in reviews:
+                reviews.append(record['review'])
+    elif op == 'game':
+        # 更新版本時保留舊評論
+        entry = dict(record['entry'])
+        entry['reviews'] = data['games'].get(record['name'], {}).get('reviews', [])
+        data['games'][record['name']] = entry
+    elif op == 'remove_game':
+        data['games'].pop(record['name'], None)
+    elif op == 'sha256':
+        game = data['games'].get(record['name'])
+        if game is not None:
+            game['sha256'] = record['sha256']
+
+class Rating:
+    """一款遊戲的評分統計：總分、人數與 1~5 分各幾人"""
+    __slots__ = ('total', 'count', 'histogram')
+
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+        self.histogram = [0] * 5
+
+    def add(self, score, n=1):
+        self.total += score * n
+        self.count += n
+        if 1 <= score <= 5:
+            self.histogram[score - 1] += n
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0
+
+    def to_dict(self):
+        return {'average': round(self.average, 2), 'count': self.count, 'histogram': list(self.histogram)}
+
+class RatingBook:
+    """
+    所有遊戲的評分統計，新增評論時增量更新，載入時由評論重建
+    商城列表直接讀這裡，不必每次走過所有評論
+    """
+    def __init__(self):
+        self._ratings = {}
+        self._lock = threading.Lock()
+
+    def add(self, game, score, n=1):
+        with self._lock:
+            rating = self._ratings.get(game)
+            if rating is None:
+                rating = self._ratings[game] = Rating()
+            rating.add(score, n)
+
+    def drop(self, game):
+        with self._lock:
+            self._ratings.pop(game, None)
+
+    def clear(self):
+        with self._lock:
+            self._ratings.clear()
+
+    def summary(self, game):
+        """回傳 (平均分數, 評論數)"""
+        with self._lock:
+            rating = self._ratings.get(game)
+            return (rating.average, rating.count) if rating else (0, 0)
+
+    def to_dict(self, game):
+        with self._lock:
+            return (self._ratings.get(game) or Rating()).to_dict()
+
+class Persister:
+    """
+    Write-behind journal：每次修改只產生一筆小紀錄，背景 thread 在 delay 秒的時間窗後
+    把累積的紀錄一次 append 到 journal。journal 超過 compact_every 筆時，
+    把 snapshot() 的內容寫成新的 snapshot 檔 (temp 檔 + rename) 並清空 journal
+    """
+    def __init__(self, snapshot_path, journal_path, snapshot, delay=SAVE_DELAY, compact_every=COMPACT_EVERY):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.snapshot = snapshot
+        self.delay = delay
+        self.compact_every = compact_every
+        self.journal_records = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, record):
+        with self._lock:
+            self._pending.append(record)
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait()
+            if self._stopping:
+                return
+            time.sleep(self.delay) # 合併時間窗內的其他修改
+            self._wake.clear()
+            self.write()
+            if self.journal_records >= self.compact_every:
+                self.compact()
+
+    def write(self):
+        with self._lock:
+            records, self._pending = self._pending, []
+        if not records:
+            return
+        try:
+            with open(self.journal_path, 'a') as f:
+                f.write(''.join(json.dumps(r) + '\n' for r in records))
+                f.flush()
+                os.fsync(f.fileno())
+            self.journal_records += len(records)
+        except Exception as e:
+            print(f"[Error] Journal append failed: {e}")
+            with self._lock:
+                self._pending[:0] = records
+
+    def compact(self):
+        # 先把 journal 移到 .old，之後的紀錄寫進新的 journal；snapshot 寫好後才刪掉 .old
+        old_path = self.journal_path + '.old'
+        try:
+            if os.path.exists(self.journal_path):
+                if os.path.exists(old_path):
+                    # 上次壓縮沒完成，兩份接起來
+                    with open(self.journal_path, 'r') as src, open(old_path, 'a') as dst:
+                        dst.write(src.read())
+                    os.remove(self.journal_path)
+                else:
+                    os.replace(self.journal_path, old_path)
+            self.journal_records = 0
+        except Exception as e:
+            print(f"[Error] Journal rotate failed: {e}")
+            return
+
+        for _ in range(3):
+            try:
+                content = json.dumps(self.snapshot())
+                break
+            except RuntimeError:
+                continue # 序列化途中有 request thread 修改資料，重試
+        else:
+            return # .old 保留，下次壓縮再處理
+
+        tmp_path = self.snapshot_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            if os.path.exists(old_path):
+                os.remove(old_path)
+            print("[DB] Journal compacted into snapshot.")
+        except Exception as e:
+            print(f"[Error] Save DB snapshot failed: {e}")
+
+    def flush(self):
+        """關閉前呼叫：停止背景 thread，寫入尚未存檔的修改並壓縮成 snapshot"""
+        self._stopping = True
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=self.delay + 5)
+        self.write()
+        if self.journal_records or os.path.exists(self.journal_path + '.old'):
+            self.compact()
+
+class JsonStore:
+    """整份資料放在記憶體；修改以 journal 紀錄寫入，定期併回 db.json"""
+    def __init__(self, snapshot_path, journal_path, delay=SAVE_DELAY, compact_every=COMPACT_EVERY):
+        self.data = {"developers": {}, "players": {}, "games": {}, "user_history": {}}
+        self.ratings = RatingBook()
+        self.persister = Persister(snapshot_path, journal_path, self._snapshot, delay, compact_every)
+
+    def load(self):
+        path = self.persister.snapshot_path
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    content = f.read()
+                    if content:
+                        loaded = json.loads(content)
+                        for key in self.data:
+                            self.data[key] = loaded.get(key, {})
+            except Exception as e:
+                print(f"[Warning] DB load failed: {e}, using empty DB")
+
+        # snapshot 之後的修改記在 journal (上次壓縮中斷時還會留著 .old)
+        journal = self.persister.journal_path
+        replayed = 0
+        for path in (journal + '.old', journal):
+            replayed += self._replay(path)
+        self.persister.journal_records = replayed
+        if replayed:
+            print(f"[DB] Replayed {replayed} journal records.")
+
+        self.ratings.clear()
+        for name, g in self.data['games'].items():
+            for review in g.get('reviews', []):
+                self.ratings.add(name, review['score'])
+
+    def _replay(self, path):
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break # 寫到一半當機留下的殘行
+                apply_record(self.data, record, replay=True)
+                count += 1
+        return count
+
+    def _snapshot(self):
+        return dict(self.data, rooms={})
+
+    def start(self):
+        self.persister.start()
+
+    def close(self):
+        self.persister.flush()
+
+    def _commit(self, record):
+        apply_record(self.data, record)
+        self.persister.append(record)
+
+    # === 帳號 ===
+
+    def get_password(self, role, name):
+        target_db = self.data['developers'] if role == 'developer' else self.data['players']
+        return target_db.get(name)
+
+    def add_user(self, role, name, password):
+        self._commit({'op': 'user', 'role': role, 'name': name, 'password': password})
+
+    # === 遊戲 ===
+
+    def has_game(self, name):
+        return name in self.data['games']
+
+    def get_game(self, name):
+        """遊戲資訊 (不含評論)，不存在時回傳 None"""
+        g = self.data['games'].get(name)
+        if g is None:
+            return None
+        return {k: v for k, v in g.items() if k != 'reviews'}
+
+    def list_games(self):
+        """回傳 [(name, info)]，info 額外帶平均分數 rating 與評論數 rating_count"""
+        result = []
+        for name, g in list(self.data['games'].items()):
+            info = {k: v for k, v in g.items() if k != 'reviews'}
+            info['rating'], info['rating_count'] = self.ratings.summary(name)
+            result.append((name, info))
+        return result
+
+    def get_rating(self, name):
+        return self.ratings.to_dict(name)
+
+    def put_game(self, name, entry):
+        """新增或更新遊戲 (保留原有評論)"""
+        self._commit({'op': 'game', 'name': name, 'entry': entry})
+
+    def remove_game(self, name):
+        self._commit({'op': 'remove_game', 'name': name})
+        self.ratings.drop(name)
+
+    def set_sha256(self, name, digest):
+        self._commit({'op': 'sha256', 'name': name, 'sha256': digest})
+
+    # === 評論 / 遊玩紀錄 ===
+
+    def review_page(self, name, cursor=None, limit=10):
+        """由新到舊取 limit 則評論，回傳 (評論, next_cursor)；cursor 是評論在清單中的位置"""
+        reviews = self.data['games'].get(name, {}).get('reviews', [])
+        end = len(reviews) if cursor is None else min(cursor, len(reviews))
+        start = max(0, end - limit)
+        return reviews[start:end][::-1], (start if start > 0 else None)
+
+    def add_review(self, name, review):
+        self._commit({'op': 'review', 'game': name, 'review': review})
+        if name in self.data['games']:
+            self.ratings.add(name, review['score'])
+
+    def has_played(self, user, game):
+        return game in self.data['user_history'].get(user, [])
+
+    def add_history(self, user, game):
+        if not self.has_played(user, game):
+            self._commit({'op': 'history', 'user': user, 'game': game})
+
+GAME_COLUMNS = ('author', 'version', 'description', 'path', 'min_players', 'max_players', 'game_type', 'sha256', 'updated')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (name TEXT PRIMARY KEY, password TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS developers (name TEXT PRIMARY KEY, password TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS games (
+    name TEXT PRIMARY KEY, author TEXT, version TEXT, description TEXT, path TEXT,
+    min_players INTEGER, max_players INTEGER, game_type TEXT, sha256 TEXT, updated REAL
+);
+CREATE INDEX IF NOT EXISTS games_author ON games(author);
+CREATE TABLE IF NOT EXISTS reviews (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, game TEXT NOT NULL, user TEXT NOT NULL,
+    score INTEGER NOT NULL, comment TEXT, time REAL
+);
+CREATE INDEX IF NOT EXISTS reviews_feed ON reviews(game, id);
+CREATE TABLE IF NOT EXISTS user_history (
+    user TEXT NOT NULL, game TEXT NOT NULL, PRIMARY KEY (user, game)
+) WITHOUT ROWID;
+"""
+
+class SqliteStore:
+    """資料放在 SQLite (WAL 模式)；所有 thread 共用一條連線，以 lock 保護"""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+        self.ratings = RatingBook()
+
+    def load(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(games)")}
+        for column in GAME_COLUMNS:
+            if column not in columns:
+                # 舊版建立的資料庫缺少後來新增的欄位
+                self._db.execute(f"ALTER TABLE games ADD COLUMN {column}")
+        self.rebuild_ratings()
+
+    def rebuild_ratings(self):
+        self.ratings.clear()
+        for game, score, n in self._query("SELECT game, score, COUNT(*) FROM reviews GROUP BY game, score"):
+            self.ratings.add(game, score, n)
+
+    def start(self):
+        pass
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            self._db.execute(sql, args)
+
+    def is_empty(self):
+        return not any(self._query(f"SELECT 1 FROM {table} LIMIT 1")
+                       for table in ('players', 'developers', 'games'))
+
+    def import_json(self, json_store):
+        """把 JsonStore (db.json + journal) 的內容整批匯入，回傳匯入的遊戲數"""
+        data = json_store.data
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN")
+            try:
+                db.executemany("INSERT OR REPLACE INTO players VALUES (?, ?)", data['players'].items())
+                db.executemany("INSERT OR REPLACE INTO developers VALUES (?, ?)", data['developers'].items())
+                for name, g in data['games'].items():
+                    db.execute(f"INSERT OR REPLACE INTO games (name, {', '.join(GAME_COLUMNS)}) VALUES (?{', ?' * len(GAME_COLUMNS)})",
+                               (name,) + tuple(g.get(c) for c in GAME_COLUMNS))
+                    db.executemany("INSERT INTO reviews (game, user, score, comment, time) VALUES (?, ?, ?, ?, ?)",
+                                   [(name, r['user'], r['score'], r.get('comment', ''), r.get('time')) for r in g.get('reviews', [])])
+                db.executemany("INSERT OR IGNORE INTO user_history VALUES (?, ?)",
+                               [(user, game) for user, games in data['user_history'].items() for game in games])
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        self.rebuild_ratings()
+        return len(data['games'])
+
+    # === 帳號 ===
+
+    def get_password(self, role, name):
+        table = 'developers' if role == 'developer' else 'players'
+        rows = self._query(f"SELECT password FROM {table} WHERE name = ?", (name,))
+        return rows[0][0] if rows else None
+
+    def add_user(self, role, name, password):
+        table = 'developers' if role == 'developer' else 'players'
+        self._execute(f"INSERT OR REPLACE INTO {table} VALUES (?, ?)", (name, password))
+
+    # === 遊戲 ===
+
+    @staticmethod
+    def _game_info(row):
+        # 舊資料匯入時可能缺欄位，與 JsonStore 一樣省略，由呼叫端套用預設值
+        return {c: v for c, v in zip(GAME_COLUMNS, row) if v is not None}
+
+    def has_game(self, name):
+        return bool(self._query("SELECT 1 FROM games WHERE name = ?", (name,)))
+
+    def get_game(self, name):
+        rows = self._query(f"SELECT {', '.join(GAME_COLUMNS)} FROM games WHERE name = ?", (name,))
+        return self._game_info(rows[0]) if rows else None
+
+    def list_games(self):
+        rows = self._query(f"SELECT name, {', '.join(GAME_COLUMNS)} FROM games")
+        result = []
+        for row in rows:
+            info = self._game_info(row[1:])
+            info['rating'], info['rating_count'] = self.ratings.summary(row[0])
+            result.append((row[0], info))
+        return result
+
+    def get_rating(self, name):
+        return self.ratings.to_dict(name)
+
+    def put_game(self, name, entry):
+        cols = [c for c in GAME_COLUMNS if c in entry]
+        self._execute(f"INSERT INTO games (name, {', '.join(cols)}) VALUES (?{', ?' * len(cols)}) "
+                      f"ON CONFLICT(name) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in cols)}",
+                      (name,) + tuple(entry[c] for c in cols))
+
+    def remove_game(self, name):
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN")
+            try:
+                db.execute("DELETE FROM reviews WHERE game = ?", (name,))
+                db.execute("DELETE FROM games WHERE name = ?", (name,))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        self.ratings.drop(name)
+
+    def set_sha256(self, name, digest):
+        self._execute("UPDATE games SET sha256 = ? WHERE name = ?", (digest, name))
+
+    # === 評論 / 遊玩紀錄 ===
+
+    def review_page(self, name, cursor=None, limit=10):
+        """由新到舊取 limit 則評論，回傳 (評論, next_cursor)；cursor 是評論的 id"""
+        if cursor is None:
+            rows = self._query("SELECT id, user, score, comment, time FROM reviews WHERE game = ? "
+                               "ORDER BY id DESC LIMIT ?", (name, limit + 1))
+        else:
+            rows = self._query("SELECT id, user, score, comment, time FROM reviews WHERE game = ? AND id < ? "
+                               "ORDER BY id DESC LIMIT ?", (name, cursor, limit + 1))
+        page = [{'user': u, 'score': s, 'comment': c, 'time': t} for _, u, s, c, t in rows[:limit]]
+        return page, (rows[limit - 1][0] if len(rows) > limit else None)
+
+    def add_review(self, name, review):
+        self._execute("INSERT INTO reviews (game, user, score, comment, time) VALUES (?, ?, ?, ?, ?)",
+                      (name, review['user'], review['score'], review['comment'], review['time']))
+        self.ratings.add(name, review['score'])
+
+    def has_played(self, user, game):
+        return bool(self._query("SELECT 1 FROM user_history WHERE user = ? AND game = ?", (user, game)))
+
+    def add_history(self, user, game):
+        self._execute("INSERT OR IGNORE INTO user_history VALUES (?, ?)", (user, game))
@@ -0,0 +1,108 @@
+"""
+預先啟動的遊戲 server 行程池 (fork-server 的做法，但用一般子行程，不依賴 os.fork)
+
+最近開過房間的幾款遊戲各保留 size 個已啟動、已載入 import 的閒置行程 (server/game_worker.py)，
+START_GAME 時把參數交給其中一個，省下直譯器啟動與 import 的時間；沒有閒置行程時照舊直接啟動。
+遊戲更新版本 (解壓目錄改變) 或被擠出最近使用清單時，回收它的閒置行程。
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+from collections import OrderedDict
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'game_worker.py')
+WARM_WORKERS = 1 # 每款遊戲保留的閒置行程數
+MAX_WARM_GAMES = 8
+
+class WorkerPool:
+    def __init__(self, size=WARM_WORKERS, max_games=MAX_WARM_GAMES):
+        self.size = size
+        self.max_games = max_games
+        self._lock = threading.Lock()
+        self._games = OrderedDict() # game_name -> [target, script, 閒置行程]，最近使用的在最後
+        self.warm_starts = 0
+        self.cold_starts = 0
+
+    def warm(self, game_name, target, script):
+        """在背景補滿這款遊戲的閒置行程"""
+        if self.size > 0:
+            threading.Thread(target=self._fill, args=(game_name, target, script), daemon=True).start()
+
+    def _fill(self, game_name, target, script):
+        stale = []
+        with self._lock:
+            entry = self._games.get(game_name)
+            if entry is None or entry[:2] != [target, script]:
+                # 第一次預熱或遊戲已更新：舊版本的閒置行程一併回收
+                if entry: stale.extend(entry[2])
+                entry = self._games[game_name] = [target, script, []]
+            self._games.move_to_end(game_name)
+            while len(self._games) > self.max_games:
+                _, old = self._games.popitem(last=False)
+                stale.extend(old[2])
+            entry[2] = [p for p in entry[2] if p.poll() is None]
+            missing = self.size - len(entry[2])
+        for proc in stale:
+            self._stop(proc)
+
+        for _ in range(missing):
+            try:
+                proc = subprocess.Popen([sys.executable, WORKER_SCRIPT, script], cwd=target, stdin=subprocess.PIPE)
+            except OSError as e:
+                print(f"[Worker Pool] Prewarm {game_name} failed: {e}")
+                return
+            with self._lock:
+                # 啟動期間遊戲可能已更新或被擠出，或同時有其他 thread 補滿
+                if self._games.get(game_name) is entry and len(entry[2]) < self.size:
+                    entry[2].append(proc)
+                    continue
+            self._stop(proc)
+
+    def launch(self, game_name, target, script, args):
+        """啟動一場遊戲 server (等同 Popen([python, script] + args, cwd=target))，回傳 Popen"""
+        proc = None
+        with self._lock:
+            entry = self._games.get(game_name)
+            if entry is not None and entry[:2] == [target, script]:
+                while entry[2] and proc is None:
+                    candidate = entry[2].pop()
+                    if candidate.poll() is None:
+                        proc = candidate
+        if proc is not None:
+            try:
+                proc.stdin.write((json.dumps(args) + '\n').encode())
+                proc.stdin.close()
+                with self._lock:
+                    self.warm_starts += 1
+                return proc
+            except OSError:
+                self._stop(proc)
+        proc = subprocess.Popen([sys.executable, script] + args, cwd=target)
+        with self._lock:
+            self.cold_starts += 1
+        return proc
+
+    @staticmethod
+    def _stop(proc):
+        # 閒置行程讀到 stdin EOF 就會自行結束
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            proc.kill()
+
+    def close(self):
+        with self._lock:
+            idle = [p for entry in self._games.values() for p in entry[2]]
+            self._games.clear()
+        for proc in idle:
+            self._stop(proc)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'warm_starts': self.warm_starts, 'cold_starts': self.cold_starts,
+                'idle': {name: len(entry[2]) for name, entry in self._games.items()}
+            }